@@ -19,9 +19,27 @@ __version__ = "0.1.0"
 __author__ = "ALP Project Contributors"
 __license__ = "GPL-3.0"
 
-from .package import Package
-from .database import PackageDatabase
-from .resolver import DependencyResolver
-from .repository import Repository
-
 __all__ = ['Package', 'PackageDatabase', 'DependencyResolver', 'Repository']
+
+# Public classes are imported on first access, so importing alp (and the
+# CLI) does not load every subsystem
+_EXPORTS = {
+    'Package': '.package',
+    'PackageDatabase': '.database',
+    'DependencyResolver': '.resolver',
+    'Repository': '.repository',
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    from importlib import import_module
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
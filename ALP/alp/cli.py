@@ -6,34 +6,107 @@ Main CLI interface
 import click
 import os
 import sys
-from typing import Optional
+import time
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-from .database import PackageDatabase
-from .repository import Repository
-from .resolver import DependencyResolver
-from .downloader import Downloader
+from .database import PackageDatabase, REASON_EXPLICIT, REASON_DEPENDENCY
 from .transaction import TransactionLog, Transaction, TransactionType, TransactionStatus
-from .package import Package
+from .version import split_dependency
+
+if TYPE_CHECKING:
+    from .repository import Repository
+    from .resolver import DependencyResolver
+    from .downloader import Downloader
 
 
 class ALPContext:
-    """ALP context class"""
+    """ALP context class
+    Subsystems are built, and their modules imported, on first use: a
+    command only pays for what it touches.
+    """
     
     def __init__(self):
-        db_path = os.getenv('ALP_DB_PATH', './alp_data/packages.db')
-        cache_dir = os.getenv('ALP_CACHE_DIR', './alp_data/cache')
-        log_dir = os.getenv('ALP_LOG_DIR', './alp_data/logs')
-        
-        self.database = PackageDatabase(db_path)
-        self.repository = Repository(self.database, cache_dir)
-        self.resolver = DependencyResolver(self.database, self.repository)
-        self.downloader = Downloader(cache_dir)
-        self.transaction_log = TransactionLog(log_dir)
+        self.db_path = os.getenv('ALP_DB_PATH', './alp_data/packages.db')
+        self.cache_dir = os.getenv('ALP_CACHE_DIR', './alp_data/cache')
+        self.log_dir = os.getenv('ALP_LOG_DIR', './alp_data/logs')
+    
+    @cached_property
+    def database(self) -> PackageDatabase:
+        return PackageDatabase(self.db_path)
+    
+    @cached_property
+    def repository(self) -> 'Repository':
+        from .repository import Repository
+        return Repository(self.database, self.cache_dir)
+    
+    @cached_property
+    def resolver(self) -> 'DependencyResolver':
+        from .resolver import DependencyResolver
+        return DependencyResolver(self.database, self.repository)
+    
+    @cached_property
+    def downloader(self) -> 'Downloader':
+        from .downloader import Downloader
+        return Downloader(self.cache_dir)
+    
+    @cached_property
+    def transaction_log(self) -> TransactionLog:
+        return TransactionLog(self.log_dir)
 
 
 pass_context = click.make_pass_decorator(ALPContext, ensure=True)
 
 
+def _download_packages(ctx: ALPContext, packages: List[Dict], downloaded_files: List[str],
+                       jobs: Optional[int], per_host: Optional[int]) -> Dict[str, Dict]:
+    """Download and verify every package of a plan concurrently
+    Returns name -> metadata with its file list, ready for the database;
+    the first failure cancels the other downloads and is raised.
+    """
+    from .downloader import DownloadScheduler, DownloadTask
+    
+    tasks = []
+    for pkg in packages:
+        pkg_url = ctx.repository.get_package_url(pkg['name'], pkg['version'])
+        if not pkg_url:
+            raise ValueError(f"URL not found: {pkg['name']}")
+        
+        dest_path = os.path.join(ctx.downloader.cache_dir, f"{pkg['name']}-{pkg['version']}.alp")
+        downloaded_files.append(dest_path)
+        tasks.append(DownloadTask(pkg_url, dest_path, pkg.get('size', 0), pkg.get('checksum', ''), pkg))
+    
+    prepared = {}
+    
+    def finish(task):
+        prepared[task.data['name']] = dict(task.data, files=ctx.repository.get_package_files(task.data))
+    
+    # One progress line, redrawn at most ten times a second on a terminal
+    live = sys.stdout.isatty()
+    last_drawn = [0.0]
+    
+    def progress(done, total, received, total_bytes):
+        now = time.monotonic()
+        if live and (done == total or now - last_drawn[0] >= 0.1):
+            last_drawn[0] = now
+            click.echo(f"\r  {done}/{total} packages, "
+                       f"{received / (1024 * 1024):.2f}/{total_bytes / (1024 * 1024):.2f} MB", nl=False)
+    
+    scheduler = DownloadScheduler(ctx.downloader, jobs, per_host)
+    started = time.monotonic()
+    
+    try:
+        scheduler.run(tasks, progress, finish)
+    finally:
+        if live:
+            click.echo()
+    
+    click.echo(f"  ✓ {len(tasks)} package(s) downloaded and verified in {time.monotonic() - started:.1f}s "
+               f"({scheduler.jobs} at a time, {scheduler.per_host} per host)")
+    
+    return prepared
+
+
 @click.group()
 @click.version_option(version='0.1.0')
 @click.pass_context
@@ -46,8 +119,12 @@ def cli(ctx):
 @click.argument('packages', nargs=-1, required=True)
 @click.option('--yes', '-y', is_flag=True, help='Skip confirmation')
 @click.option('--no-deps', is_flag=True, help='Do not install dependencies')
+@click.option('--jobs', '-j', type=int, envvar='ALP_DOWNLOAD_JOBS',
+              help='Packages to download at once (default: 16)')
+@click.option('--per-host', type=int, envvar='ALP_DOWNLOAD_PER_HOST',
+              help='Downloads at once from one host (default: 8)')
 @pass_context
-def install(ctx: ALPContext, packages, yes, no_deps):
+def install(ctx: ALPContext, packages, yes, no_deps, jobs, per_host):
     """Install package"""
     click.echo(f"📦 {len(packages)} package(s) will be installed...")
     
@@ -60,27 +137,47 @@ def install(ctx: ALPContext, packages, yes, no_deps):
             click.echo("🔍 Resolving dependencies...")
             result = ctx.resolver.resolve(list(packages))
             
-            if result['missing']:
-                click.echo(f"❌ Missing packages: {', '.join(result['missing'])}")
-                transaction.set_status(TransactionStatus.FAILED, "Missing dependencies")
-                ctx.transaction_log.save_transaction(transaction)
-                return
-            
-            if result['conflicts']:
-                click.echo(f"⚠️  Conflicting packages: {', '.join(result['conflicts'])}")
-                transaction.set_status(TransactionStatus.FAILED, "Conflicting packages")
+            if result['missing'] or result['conflicts'] or result['explanation']:
+                if result['missing']:
+                    click.echo(f"❌ Missing packages: {', '.join(result['missing'])}")
+                    reason = "Missing dependencies"
+                elif result['conflicts']:
+                    reason = "Conflicting packages"
+                else:
+                    reason = "Unsatisfiable dependencies"
+                
+                if result['conflicts']:
+                    click.echo(f"⚠️  Conflicting packages: {', '.join(result['conflicts'])}")
+                    for package, other in result['conflict_pairs']:
+                        click.echo(f"   - {package} conflicts with {other}")
+                
+                if result['explanation']:
+                    click.echo("❌ Dependencies cannot be satisfied:")
+                    for line in result['explanation']:
+                        click.echo(f"   - {line}")
+                
+                transaction.set_status(TransactionStatus.FAILED, reason)
                 ctx.transaction_log.save_transaction(transaction)
                 return
             
             to_install = result['install']
+            waves = result['waves']
+            
+            for cycle in result['cycles']:
+                click.echo(f"⚠️  Dependency cycle, installed together: {', '.join(cycle)}")
         else:
             to_install = []
             for pkg_name in packages:
                 metadata = ctx.repository.get_package_metadata(pkg_name)
                 if metadata:
                     to_install.append(metadata)
+            waves = [to_install]
+        
+        requested = {split_dependency(spec)[0] for spec in packages}
         
         if not to_install:
+            for pkg_name in requested:
+                ctx.database.set_reason(pkg_name, REASON_EXPLICIT)
             click.echo("✅ All packages are already installed")
             transaction.set_status(TransactionStatus.COMPLETED)
             ctx.transaction_log.save_transaction(transaction)
@@ -93,7 +190,7 @@ def install(ctx: ALPContext, packages, yes, no_deps):
             total_size += pkg.get('size', 0)
             click.echo(f"  - {pkg['name']}-{pkg['version']} ({size_mb:.2f} MB)")
         
-        click.echo(f"\nTotal download: {total_size / (1024 * 1024):.2f} MB")
+        click.echo(f"\nTotal download: {total_size / (1024 * 1024):.2f} MB in {len(waves)} wave(s)")
         
         if not yes:
             if not click.confirm('Continue?'):
@@ -102,86 +199,56 @@ def install(ctx: ALPContext, packages, yes, no_deps):
                 ctx.transaction_log.save_transaction(transaction)
                 return
         
-        newly_installed = []
-        previously_installed_snapshots = {}
+        previously_installed = ctx.database.get_packages([pkg['name'] for pkg in to_install], columns=('name',))
         downloaded_files = []
         
-        for pkg in to_install:
-            pkg_name = pkg['name']
+        try:
+            # Downloads don't depend on install order: the whole plan is
+            # fetched before the first wave is installed
+            click.echo(f"\n📥 Downloading {len(to_install)} package(s)...")
+            prepared = _download_packages(ctx, to_install, downloaded_files, jobs, per_host)
             
-            if ctx.database.is_installed(pkg_name):
-                snapshot = ctx.database.get_package(pkg_name)
-                if snapshot:
-                    previously_installed_snapshots[pkg_name] = snapshot
+            # The whole install is one database transaction, each wave a
+            # savepoint; a failure anywhere leaves the database untouched
+            with ctx.database.transaction():
+                for number, wave in enumerate(waves, 1):
+                    click.echo(f"\n📦 Installing wave {number}/{len(waves)}...")
+                    with ctx.database.transaction():
+                        for pkg in wave:
+                            pkg = prepared[pkg['name']]
+                            pkg_name = pkg['name']
+                            pkg_version = pkg['version']
+                            
+                            if pkg_name in requested or requested.intersection(pkg.get('provides') or []):
+                                reason = REASON_EXPLICIT
+                            elif pkg_name in previously_installed:
+                                reason = None
+                            else:
+                                reason = REASON_DEPENDENCY
+                            
+                            ctx.database.add_package(pkg, reason)
+                            transaction.add_action('install', {'package': pkg_name, 'version': pkg_version})
+                            
+                            click.echo(f"✅ {pkg_name}-{pkg_version} installed")
+                
+                # Requested packages that were already installed as dependencies
+                for pkg_name in requested:
+                    ctx.database.set_reason(pkg_name, REASON_EXPLICIT)
         
-        for pkg in to_install:
-            pkg_name = pkg['name']
-            pkg_version = pkg['version']
-            dest_path = os.path.join(ctx.downloader.cache_dir, f"{pkg_name}-{pkg_version}.alp")
+        except Exception as pkg_error:
+            click.echo(f"\n❌ Installation failed: {pkg_error}")
+            click.echo("↩️  Database changes rolled back")
             
-            try:
-                click.echo(f"\n📥 Downloading {pkg_name}-{pkg_version}...")
-                
-                pkg_url = ctx.repository.get_package_url(pkg_name, pkg_version)
-                if not pkg_url:
-                    raise ValueError(f"URL not found: {pkg_name}")
-                
-                def progress_callback(percent, downloaded, total):
-                    click.echo(f"\r  Progress: {percent:.1f}% ({downloaded}/{total} bytes)", nl=False)
-                
-                success = ctx.downloader.download(pkg_url, dest_path, progress_callback)
-                click.echo()
-                
-                if not success:
-                    raise RuntimeError(f"Download failed: {pkg_name}")
-                
-                downloaded_files.append(dest_path)
-                click.echo(f"✓ Download completed")
-                
-                if pkg.get('checksum'):
-                    click.echo(f"🔐 Verifying checksum...")
-                    if not ctx.downloader.verify_checksum(dest_path, pkg['checksum']):
-                        raise ValueError(f"Checksum error: {pkg_name}")
-                    click.echo(f"✓ Checksum verified")
-                
-                click.echo(f"📦 Installing...")
-                ctx.database.add_package(pkg)
-                
-                if pkg_name not in previously_installed_snapshots:
-                    newly_installed.append(pkg_name)
-                
-                transaction.add_action('install', {'package': pkg_name, 'version': pkg_version})
-                
-                click.echo(f"✅ {pkg_name}-{pkg_version} installed")
+            for file_path in downloaded_files:
+                try:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                except Exception:
+                    pass
             
-            except Exception as pkg_error:
-                click.echo(f"\n❌ {pkg_name} installation failed: {pkg_error}")
-                click.echo(f"🔄 Rolling back...")
-                
-                for new_pkg in newly_installed:
-                    try:
-                        ctx.database.remove_package(new_pkg)
-                        click.echo(f"  ↩️  {new_pkg} removed")
-                    except Exception as rollback_error:
-                        click.echo(f"  ⚠️  {new_pkg} rollback error: {rollback_error}")
-                
-                for upgraded_pkg, snapshot in previously_installed_snapshots.items():
-                    try:
-                        ctx.database.add_package(snapshot)
-                        click.echo(f"  ↩️  {upgraded_pkg} restored to previous version")
-                    except Exception as restore_error:
-                        click.echo(f"  ⚠️  {upgraded_pkg} restore error: {restore_error}")
-                
-                for file_path in downloaded_files:
-                    try:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                    except Exception:
-                        pass
-                
-                transaction.set_status(TransactionStatus.FAILED, str(pkg_error))
-                ctx.transaction_log.save_transaction(transaction)
-                raise
+            transaction.set_status(TransactionStatus.FAILED, str(pkg_error))
+            ctx.transaction_log.save_transaction(transaction)
+            raise
         
         transaction.set_status(TransactionStatus.COMPLETED)
         ctx.transaction_log.save_transaction(transaction)
@@ -199,19 +266,25 @@ def install(ctx: ALPContext, packages, yes, no_deps):
 @pass_context
 def remove(ctx: ALPContext, packages, yes):
     """Remove package"""
+    # A name given twice is removed once
+    packages = list(dict.fromkeys(packages))
     click.echo(f"🗑️  {len(packages)} package(s) will be removed...")
     
-    transaction = Transaction(TransactionType.REMOVE, list(packages))
+    transaction = Transaction(TransactionType.REMOVE, packages)
     transaction.set_status(TransactionStatus.IN_PROGRESS)
     ctx.transaction_log.save_transaction(transaction)
     
     try:
+        installed = ctx.database.get_packages(packages, columns=('name',))
+        to_remove = []
+        
+        # Checks and prompts come first: the write lock is only taken below
         for pkg_name in packages:
-            if not ctx.database.is_installed(pkg_name):
+            if pkg_name not in installed:
                 click.echo(f"⚠️  {pkg_name} is not installed")
                 continue
             
-            can_remove, reverse_deps = ctx.resolver.can_remove(pkg_name)
+            can_remove, reverse_deps = ctx.resolver.can_remove(pkg_name, packages)
             
             if not can_remove:
                 click.echo(f"❌ {pkg_name} cannot be removed. Dependent packages:")
@@ -224,10 +297,22 @@ def remove(ctx: ALPContext, packages, yes):
                     click.echo("❌ Cancelled")
                     continue
             
-            click.echo(f"🗑️  Removing {pkg_name}...")
-            ctx.database.remove_package(pkg_name)
-            transaction.add_action('remove', {'package': pkg_name})
+            to_remove.append(pkg_name)
+        
+        # All removals commit together, or none of them
+        with ctx.database.transaction():
+            for pkg_name in to_remove:
+                click.echo(f"🗑️  Removing {pkg_name}...")
+                ctx.database.remove_package(pkg_name)
+                transaction.add_action('remove', {'package': pkg_name})
             
+            # Packages of the batch that were kept may still need removed ones
+            for pkg_name in to_remove:
+                dependents = ctx.resolver.get_reverse_dependencies(pkg_name)
+                if dependents:
+                    raise RuntimeError(f"{pkg_name} is still needed by {', '.join(dependents)}, nothing removed")
+        
+        for pkg_name in to_remove:
             click.echo(f"✅ {pkg_name} removed")
         
         transaction.set_status(TransactionStatus.COMPLETED)
@@ -240,14 +325,106 @@ def remove(ctx: ALPContext, packages, yes):
         ctx.transaction_log.save_transaction(transaction)
 
 
+@cli.command()
+@click.option('--yes', '-y', is_flag=True, help='Skip confirmation')
+@pass_context
+def autoremove(ctx: ALPContext, yes):
+    """Remove packages installed as dependencies that nothing needs anymore"""
+    click.echo("🔍 Looking for unneeded packages...")
+    
+    orphans = ctx.resolver.find_orphans()
+    
+    if not orphans:
+        click.echo("✅ No unneeded packages")
+        return
+    
+    click.echo(f"\nPackages to remove ({len(orphans)}):")
+    for pkg in orphans:
+        click.echo(f"  - {pkg['name']}-{pkg['version']}")
+    
+    if not yes:
+        if not click.confirm('Continue?'):
+            click.echo("❌ Cancelled")
+            return
+    
+    names = [pkg['name'] for pkg in orphans]
+    transaction = Transaction(TransactionType.REMOVE, names)
+    transaction.set_status(TransactionStatus.IN_PROGRESS)
+    ctx.transaction_log.save_transaction(transaction)
+    
+    try:
+        ctx.database.remove_packages(names)
+        for name in names:
+            transaction.add_action('remove', {'package': name})
+        
+        transaction.set_status(TransactionStatus.COMPLETED)
+        ctx.transaction_log.save_transaction(transaction)
+        click.echo(f"\n✅ {len(names)} package(s) removed")
+    
+    except Exception as e:
+        click.echo(f"\n❌ Error: {e}")
+        transaction.set_status(TransactionStatus.FAILED, str(e))
+        ctx.transaction_log.save_transaction(transaction)
+
+
+@cli.command()
+@click.argument('package', required=True)
+@click.option('--recursive', '-r', is_flag=True, help='Include indirect dependents')
+@pass_context
+def rdepends(ctx: ALPContext, package, recursive):
+    """Show installed packages that depend on a package"""
+    dependents = ctx.resolver.get_reverse_dependencies(package, recursive)
+    
+    if not dependents:
+        click.echo(f"No installed package depends on {package}")
+        return
+    
+    kind = "directly or indirectly " if recursive else ""
+    click.echo(f"🔗 {len(dependents)} package(s) {kind}depend on {package}:\n")
+    for name in dependents:
+        click.echo(f"  - {name}")
+
+
+@cli.command()
+@click.argument('path', required=True)
+@pass_context
+def owns(ctx: ALPContext, path):
+    """Show which installed package owns a file"""
+    path = os.path.normpath(path)
+    owners = ctx.database.get_file_owners([path]).get(path)
+    
+    if not owners:
+        click.echo(f"❌ No installed package owns {path}")
+        return
+    
+    for name in owners:
+        click.echo(f"{path} is owned by {name}")
+
+
+@cli.command()
+@click.argument('package', required=True)
+@pass_context
+def files(ctx: ALPContext, package):
+    """List the files of an installed package"""
+    file_list = ctx.database.get_package_files(package)
+    
+    if file_list is None:
+        click.echo(f"⚠️  {package} is not installed")
+        return
+    
+    for file_path in file_list:
+        click.echo(file_path)
+
+
 @cli.command()
 @click.argument('query', required=True)
+@click.option('--limit', '-l', type=int, default=None, help='Maximum number of results')
 @pass_context
-def search(ctx: ALPContext, query):
+def search(ctx: ALPContext, query, limit):
     """Search for package"""
     click.echo(f"🔍 Searching for '{query}'...")
     
-    results = ctx.repository.search_package(query)
+    results = ctx.repository.search_package(query, limit)
     
     if not results:
         click.echo("❌ No results found")
@@ -255,18 +432,20 @@ def search(ctx: ALPContext, query):
     
     click.echo(f"\n{len(results)} package(s) found:\n")
     
+    installed_packages = ctx.database.get_packages([pkg['name'] for pkg in results], columns=('version',))
+    
     for pkg in results:
-        installed = "✓" if ctx.database.is_installed(pkg['name']) else " "
+        installed = "✓" if pkg['name'] in installed_packages else " "
         click.echo(f"[{installed}] {pkg['name']}-{pkg['version']}")
         click.echo(f"    {pkg.get('description', 'No description')}")
         click.echo(f"    Repository: {pkg.get('repository', 'unknown')}")
         click.echo()
 
 
-@cli.command()
+@cli.command(name='list')
 @click.option('--all', '-a', is_flag=True, help='Show all available packages')
 @pass_context
-def list(ctx: ALPContext, all):
+def list_packages(ctx: ALPContext, all):
     """List installed packages"""
     if all:
         click.echo("📦 Available packages:\n")
@@ -287,19 +466,26 @@ def list(ctx: ALPContext, all):
 
 
 @cli.command()
+@click.option('--jobs', '-j', default=8, help='Repositories to refresh in parallel')
+@click.option('--timeout', default=120.0, help='Time limit for each repository update (seconds)')
 @pass_context
-def update(ctx: ALPContext):
+def update(ctx: ALPContext, jobs, timeout):
     """Update repository indexes"""
     click.echo("🔄 Updating repository indexes...")
     
-    results = ctx.repository.update_all_indexes()
+    started = time.monotonic()
+    results = ctx.repository.update_all_indexes(max_workers=jobs, timeout=timeout)
     
-    for repo_name, success in results.items():
-        if success:
-            click.echo(f"✅ {repo_name}")
+    for repo_name, result in results.items():
+        details = f"{result.status}, {result.elapsed * 1000:.0f} ms, {result.bytes / 1024:.1f} KB"
+        if result.success:
+            click.echo(f"✅ {repo_name} ({details})")
         else:
-            click.echo(f"❌ {repo_name}")
+            click.echo(f"❌ {repo_name} ({details}): {result.error}")
     
+    total_bytes = sum(result.bytes for result in results.values())
+    click.echo(f"\n{len(results)} repositories, {total_bytes / 1024:.1f} KB "
+               f"in {time.monotonic() - started:.2f} s")
     click.echo("\n✅ Update completed!")
 
 
@@ -342,11 +528,13 @@ def add_repo(ctx: ALPContext, name, url, priority):
     click.echo(f"➕ Adding repository: {name}")
     
     ctx.database.add_repository(name, url, priority)
+    ctx.repository.invalidate_package_index()
     
     click.echo(f"✅ {name} added")
     click.echo(f"🔄 Updating index...")
     
     if ctx.repository.update_index(url):
+        ctx.repository.prepare_search_index()
         click.echo(f"✅ Index updated")
     else:
         click.echo(f"❌ Index could not be updated")
@@ -5,9 +5,31 @@ Tracks installed packages and their status
 
 import sqlite3
 import json
-from typing import List, Optional, Dict
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Dict, Sequence, Tuple
 from datetime import datetime
 
+from .version import split_dependency
+
+
+# Why a package is installed: asked for by the user, or pulled in by another
+REASON_EXPLICIT = 'explicit'
+REASON_DEPENDENCY = 'dependency'
+
+# Columns of the packages table that get_packages can select
+PACKAGE_COLUMNS = ('id', 'name', 'version', 'description', 'architecture', 'maintainer',
+                   'homepage', 'license', 'size', 'checksum', 'install_date', 'status', 'reason')
+
+# Layout version kept in PRAGMA user_version, bump it with every schema
+# change: databases at this version skip _init_database on open
+# 0: files(file_path) with full paths
+# 1: files(directory_id, basename) with directories interned
+SCHEMA_VERSION = 1
+
+# Name lists longer than this are joined through a temporary table
+# instead of bound into an IN (...) list
+MAX_INLINE_NAMES = 500
+
 
 class PackageDatabase:
     """Package database class"""
@@ -17,6 +39,14 @@ class PackageDatabase:
         self._ensure_db_dir()
         self.conn = sqlite3.connect(self.db_path)
         self.conn.row_factory = sqlite3.Row
+        self._transaction_depth = 0
+        self._savepoints = 0
+        
+        # WAL with synchronous=NORMAL: one fsync per checkpoint instead of
+        # several per commit, and readers don't block the writer
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        
         self._init_database()
     
     def _ensure_db_dir(self):
@@ -27,9 +57,35 @@ class PackageDatabase:
             os.makedirs(db_dir, exist_ok=True)
     
     def _init_database(self):
-        """Create database tables"""
+        """Create database tables and migrate older layouts"""
         cursor = self.conn.cursor()
         
+        cursor.execute("PRAGMA user_version")
+        schema_version = cursor.fetchone()[0]
+        
+        # Written by this version already, nothing to create or migrate
+        if schema_version == SCHEMA_VERSION:
+            return
+        
+        # One transaction for tables, migrations and the version bump: an
+        # interrupted migration leaves the old layout untouched
+        self.begin()
+        try:
+            migrated_files = self._create_schema(cursor)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+        
+        # Give the space of the full paths back
+        if migrated_files:
+            self.conn.execute("VACUUM")
+    
+    def _create_schema(self, cursor: sqlite3.Cursor) -> bool:
+        """Create missing tables and indexes, migrating older layouts
+        Returns: whether file rows were moved to the interned layout
+        """
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS packages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,10 +99,17 @@ class PackageDatabase:
                 size INTEGER,
                 checksum TEXT,
                 install_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'installed'
+                status TEXT DEFAULT 'installed',
+                reason TEXT DEFAULT 'explicit'
             )
         """)
         
+        # Databases created before install reasons were recorded; their
+        # packages count as explicitly installed
+        cursor.execute("PRAGMA table_info(packages)")
+        if 'reason' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE packages ADD COLUMN reason TEXT DEFAULT 'explicit'")
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS dependencies (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,15 +120,71 @@ class PackageDatabase:
             )
         """)
         
+        # Full paths of layout 0 are moved into the tables below
+        cursor.execute("PRAGMA table_info(files)")
+        migrate_files = 'file_path' in [column[1] for column in cursor.fetchall()]
+        if migrate_files:
+            cursor.execute("ALTER TABLE files RENAME TO files_v0")
+            cursor.execute("DROP INDEX IF EXISTS idx_files_path")
+            cursor.execute("DROP INDEX IF EXISTS idx_files_package")
+        
+        # A path is stored as its directory (with the trailing '/') and
+        # basename; directory + basename gives the path back unchanged
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS directories (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE
+            )
+        """)
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                package_id INTEGER NOT NULL,
+                directory_id INTEGER NOT NULL,
+                basename TEXT NOT NULL,
+                FOREIGN KEY (package_id) REFERENCES packages(id),
+                FOREIGN KEY (directory_id) REFERENCES directories(id)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS provides (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                package_id INTEGER,
+                provide_name TEXT,
+                FOREIGN KEY (package_id) REFERENCES packages(id)
+            )
+        """)
+        
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_provides_name ON provides(provide_name)
+        """)
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS conflicts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 package_id INTEGER,
-                file_path TEXT,
+                conflict_name TEXT,
                 FOREIGN KEY (package_id) REFERENCES packages(id)
             )
         """)
         
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_dependencies_name ON dependencies(dependency_name)
+        """)
+        
+        # File ownership lookups (owns, file conflicts)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_files_location ON files(directory_id, basename)
+        """)
+        
+        # Per-package lookups of the installed snapshot
+        for table in ('dependencies', 'files', 'provides', 'conflicts'):
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_package ON {table}(package_id)
+            """)
+        
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS repositories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -76,25 +195,169 @@ class PackageDatabase:
             )
         """)
         
+        if migrate_files:
+            self._migrate_files_v0(cursor)
+        
+        return migrate_files
+    
+    def _migrate_files_v0(self, cursor: sqlite3.Cursor):
+        """Move full-path file rows into directories + basenames"""
+        reader = self.conn.cursor()
+        reader.execute("SELECT package_id, file_path FROM files_v0 ORDER BY id")
+        
+        while True:
+            rows = reader.fetchmany(10000)
+            if not rows:
+                break
+            
+            split = [(package_id, self._split_path(file_path or '')) for package_id, file_path in rows]
+            directory_ids = self._directory_ids(cursor, {directory for _, (directory, _) in split})
+            cursor.executemany("""
+                INSERT INTO files (package_id, directory_id, basename)
+                VALUES (?, ?, ?)
+            """, [(package_id, directory_ids[directory], basename)
+                  for package_id, (directory, basename) in split])
+        
+        cursor.execute("DROP TABLE files_v0")
+    
+    @staticmethod
+    def _split_path(path: str) -> Tuple[str, str]:
+        """(directory with trailing '/', basename) of a stored path"""
+        position = path.rfind('/') + 1
+        return path[:position], path[position:]
+    
+    def _directory_ids(self, cursor: sqlite3.Cursor, paths: Iterable[str]) -> Dict[str, int]:
+        """Ids of directory paths, interning the new ones"""
+        paths = list(paths)
+        cursor.executemany("INSERT OR IGNORE INTO directories (path) VALUES (?)", [(path,) for path in paths])
+        
+        directory_ids = {}
+        for start in range(0, len(paths), MAX_INLINE_NAMES):
+            chunk = paths[start:start + MAX_INLINE_NAMES]
+            cursor.execute(f"SELECT path, id FROM directories WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+            for path, directory_id in cursor.fetchall():
+                directory_ids[path] = directory_id
+        
+        return directory_ids
+    
+    def _delete_files(self, cursor: sqlite3.Cursor, package_id: int) -> List[int]:
+        """Delete the file rows of a package
+        Returns: ids of the directories they were in, for _prune_directories
+        """
+        cursor.execute("SELECT DISTINCT directory_id FROM files WHERE package_id = ?", (package_id,))
+        directory_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM files WHERE package_id = ?", (package_id,))
+        return directory_ids
+    
+    def _prune_directories(self, cursor: sqlite3.Cursor, directory_ids: List[int]):
+        """Drop directories no file is in anymore"""
+        cursor.executemany("""
+            DELETE FROM directories
+            WHERE id = ? AND NOT EXISTS (SELECT 1 FROM files WHERE directory_id = ?)
+        """, [(directory_id, directory_id) for directory_id in directory_ids])
+    
+    def in_transaction(self) -> bool:
+        """Is a transaction opened with begin() or transaction() active?"""
+        return self._transaction_depth > 0
+    
+    def begin(self):
+        """Start a transaction; writes stay uncommitted until commit()"""
+        if self._transaction_depth:
+            raise sqlite3.OperationalError("A transaction is already active")
+        
+        if self.conn.in_transaction:
+            self.conn.commit()
+        self.conn.execute("BEGIN")
+        self._transaction_depth = 1
+    
+    def commit(self):
+        """Commit the active transaction"""
         self.conn.commit()
+        self._transaction_depth = 0
+    
+    def rollback(self):
+        """Discard everything written since begin()"""
+        self.conn.rollback()
+        self._transaction_depth = 0
+    
+    def savepoint(self) -> str:
+        """Mark a point inside the active transaction to roll back to
+        Returns: savepoint name for release() or rollback_to()
+        """
+        if not self._transaction_depth:
+            raise sqlite3.OperationalError("No active transaction")
+        
+        self._savepoints += 1
+        name = f"alp_{self._savepoints}"
+        self.conn.execute(f"SAVEPOINT {name}")
+        self._transaction_depth += 1
+        return name
+    
+    def release(self, name: str):
+        """Keep the writes since a savepoint as part of the transaction"""
+        self.conn.execute(f"RELEASE {name}")
+        self._transaction_depth -= 1
+    
+    def rollback_to(self, name: str):
+        """Discard the writes since a savepoint and drop it"""
+        self.conn.execute(f"ROLLBACK TO {name}")
+        self.conn.execute(f"RELEASE {name}")
+        self._transaction_depth -= 1
+    
+    @contextmanager
+    def transaction(self) -> Iterator['PackageDatabase']:
+        """Run a block atomically
+        The outermost block is a transaction committed once at the end;
+        nested blocks are savepoints. An exception rolls back the writes of
+        the block it leaves, whatever the nesting.
+        """
+        if not self._transaction_depth:
+            self.begin()
+            try:
+                yield self
+            except BaseException:
+                self.rollback()
+                raise
+            self.commit()
+        else:
+            name = self.savepoint()
+            try:
+                yield self
+            except BaseException:
+                self.rollback_to(name)
+                raise
+            self.release(name)
     
-    def add_package(self, metadata: Dict) -> int:
-        """Add new package or update existing"""
+    def add_package(self, metadata: Dict, reason: Optional[str] = None) -> int:
+        """Add new package or update existing
+        reason (REASON_EXPLICIT or REASON_DEPENDENCY) defaults to
+        metadata['reason']; without either, a new package is explicit and
+        an existing one keeps its reason.
+        """
+        with self.transaction():
+            return self._write_package(metadata, reason or metadata.get('reason'))
+    
+    def _write_package(self, metadata: Dict, reason: Optional[str]) -> int:
+        """Insert or replace a package row and its child rows"""
         cursor = self.conn.cursor()
         
-        cursor.execute("SELECT id FROM packages WHERE name = ?", (metadata['name'],))
+        cursor.execute("SELECT id, reason FROM packages WHERE name = ?", (metadata['name'],))
         existing = cursor.fetchone()
+        old_directories = []
         
         if existing:
             package_id = existing[0]
+            reason = reason or existing[1] or REASON_EXPLICIT
             cursor.execute("DELETE FROM dependencies WHERE package_id = ?", (package_id,))
-            cursor.execute("DELETE FROM files WHERE package_id = ?", (package_id,))
+            old_directories = self._delete_files(cursor, package_id)
+            cursor.execute("DELETE FROM provides WHERE package_id = ?", (package_id,))
+            cursor.execute("DELETE FROM conflicts WHERE package_id = ?", (package_id,))
             
             cursor.execute("""
                 UPDATE packages 
                 SET version=?, description=?, architecture=?, 
                     maintainer=?, homepage=?, license=?, size=?, checksum=?,
-                    install_date=CURRENT_TIMESTAMP
+                    reason=?, install_date=CURRENT_TIMESTAMP
                 WHERE id=?
             """, (
                 metadata['version'],
@@ -105,13 +368,14 @@ class PackageDatabase:
                 metadata.get('license', ''),
                 metadata.get('size', 0),
                 metadata.get('checksum', ''),
+                reason,
                 package_id
             ))
         else:
             cursor.execute("""
                 INSERT INTO packages (name, version, description, architecture, 
-                                    maintainer, homepage, license, size, checksum)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                    maintainer, homepage, license, size, checksum, reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 metadata['name'],
                 metadata['version'],
@@ -121,88 +385,258 @@ class PackageDatabase:
                 metadata.get('homepage', ''),
                 metadata.get('license', ''),
                 metadata.get('size', 0),
-                metadata.get('checksum', '')
+                metadata.get('checksum', ''),
+                reason or REASON_EXPLICIT
             ))
             
             package_id = cursor.lastrowid
             if package_id is None:
                 raise ValueError("Package could not be added")
         
-        for dep in metadata.get('dependencies', []):
-            dep_parts = dep.split('>=') if '>=' in dep else [dep, '']
-            cursor.execute("""
-                INSERT INTO dependencies (package_id, dependency_name, dependency_version)
-                VALUES (?, ?, ?)
-            """, (package_id, dep_parts[0].strip(), dep_parts[1].strip() if len(dep_parts) > 1 else ''))
+        cursor.executemany("""
+            INSERT INTO dependencies (package_id, dependency_name, dependency_version)
+            VALUES (?, ?, ?)
+        """, [(package_id, *split_dependency(dep)) for dep in metadata.get('dependencies', [])])
         
-        for file_path in metadata.get('files', []):
-            cursor.execute("""
-                INSERT INTO files (package_id, file_path)
-                VALUES (?, ?)
-            """, (package_id, file_path))
+        split = [self._split_path(file_path) for file_path in metadata.get('files', [])]
+        directory_ids = self._directory_ids(cursor, {directory for directory, _ in split})
+        cursor.executemany("""
+            INSERT INTO files (package_id, directory_id, basename)
+            VALUES (?, ?, ?)
+        """, [(package_id, directory_ids[directory], basename) for directory, basename in split])
+        self._prune_directories(cursor, old_directories)
+        
+        cursor.executemany("""
+            INSERT INTO provides (package_id, provide_name)
+            VALUES (?, ?)
+        """, [(package_id, provide_name) for provide_name in metadata.get('provides', [])])
+        
+        cursor.executemany("""
+            INSERT INTO conflicts (package_id, conflict_name)
+            VALUES (?, ?)
+        """, [(package_id, conflict_name) for conflict_name in metadata.get('conflicts', [])])
         
-        self.conn.commit()
         return package_id
     
+    @staticmethod
+    def _join_dependency(name: str, version: Optional[str]) -> str:
+        """Dependency string from stored name and constraint
+        Rows written before constraints were stored hold a bare '>=' version.
+        """
+        if not version:
+            return name
+        if version[0] not in '<>=!':
+            return f"{name}>={version}"
+        return f"{name}{version}"
+    
     def remove_package(self, package_name: str) -> bool:
         """Remove package"""
+        return self.remove_packages([package_name]) > 0
+    
+    def remove_packages(self, package_names: List[str]) -> int:
+        """Remove packages in one transaction, all or none
+        Returns: number of packages removed (missing names are skipped)
+        """
         cursor = self.conn.cursor()
+        removed = 0
+        old_directories = set()
         
-        cursor.execute("SELECT id FROM packages WHERE name = ?", (package_name,))
-        row = cursor.fetchone()
-        
-        if not row:
-            return False
-        
-        package_id = row[0]
-        
-        cursor.execute("DELETE FROM dependencies WHERE package_id = ?", (package_id,))
-        cursor.execute("DELETE FROM files WHERE package_id = ?", (package_id,))
-        cursor.execute("DELETE FROM packages WHERE id = ?", (package_id,))
+        with self.transaction():
+            for package_name in package_names:
+                cursor.execute("SELECT id FROM packages WHERE name = ?", (package_name,))
+                row = cursor.fetchone()
+                
+                if not row:
+                    continue
+                
+                package_id = row[0]
+                
+                cursor.execute("DELETE FROM dependencies WHERE package_id = ?", (package_id,))
+                old_directories.update(self._delete_files(cursor, package_id))
+                cursor.execute("DELETE FROM provides WHERE package_id = ?", (package_id,))
+                cursor.execute("DELETE FROM conflicts WHERE package_id = ?", (package_id,))
+                cursor.execute("DELETE FROM packages WHERE id = ?", (package_id,))
+                removed += 1
+            
+            self._prune_directories(cursor, list(old_directories))
         
-        self.conn.commit()
-        return True
+        return removed
     
     def get_package(self, package_name: str) -> Optional[Dict]:
         """Get package information (with all metadata)"""
+        return self.get_packages([package_name], with_dependencies=True, with_files=True,
+                                 with_provides=True, with_conflicts=True).get(package_name)
+    
+    def get_packages(self, names: Optional[Iterable[str]] = None,
+                     columns: Optional[Sequence[str]] = None,
+                     with_dependencies: bool = False, with_files: bool = False,
+                     with_provides: bool = False, with_conflicts: bool = False) -> Dict[str, Dict]:
+        """Installed packages in bulk, one query per loaded table
+        
+        Args:
+            names: Package names, None for every installed package
+            columns: packages columns to load (PACKAGE_COLUMNS), all by default
+            with_*: Also load these lists; file lists are never loaded
+                unless asked for
+        
+        Returns:
+            name -> package dict, names that are not installed are left out
+        """
+        columns = list(columns or PACKAGE_COLUMNS)
+        unknown = [column for column in columns if column not in PACKAGE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown package columns: {', '.join(unknown)}")
+        
         cursor = self.conn.cursor()
+        where, params = self._name_filter(cursor, names)
+        
+        selected = ', '.join(f"p.{column}" for column in ['id', 'name'] + columns)
+        cursor.execute(f"SELECT {selected} FROM packages p WHERE {where} ORDER BY p.name", params)
+        
+        packages = {}
+        by_id = {}
+        for row in cursor.fetchall():
+            package_data = dict(zip(columns, row[2:]))
+            packages[row[1]] = package_data
+            by_id[row[0]] = package_data
+        
+        relations = [
+            ('dependencies', with_dependencies, 'dependencies', 'r.dependency_name, r.dependency_version', ''),
+            ('files', with_files, 'files', 'd.path || r.basename',
+             'JOIN directories d ON d.id = r.directory_id'),
+            ('provides', with_provides, 'provides', 'r.provide_name', ''),
+            ('conflicts', with_conflicts, 'conflicts', 'r.conflict_name', ''),
+        ]
+        
+        for key, wanted, table, fields, join in relations:
+            if not wanted or not packages:
+                continue
+            
+            for package_data in packages.values():
+                package_data[key] = []
+            
+            cursor.execute(f"""
+                SELECT r.package_id, {fields} FROM {table} r
+                JOIN packages p ON p.id = r.package_id
+                {join}
+                WHERE {where}
+                ORDER BY r.id
+            """, params)
+            
+            for row in cursor.fetchall():
+                if key == 'dependencies':
+                    value = self._join_dependency(row[1], row[2])
+                else:
+                    value = row[1]
+                by_id[row[0]][key].append(value)
+        
+        # Filling the temporary table opened an implicit transaction
+        if not self._transaction_depth and self.conn.in_transaction:
+            self.conn.commit()
+        
+        return packages
+    
+    def _name_filter(self, cursor: sqlite3.Cursor, names: Optional[Iterable[str]]) -> Tuple[str, List[str]]:
+        """WHERE clause restricting packages p to names, with its parameters"""
+        if names is None:
+            return '1', []
+        
+        names = list(dict.fromkeys(names))
+        
+        if len(names) <= MAX_INLINE_NAMES:
+            return f"p.name IN ({','.join('?' * len(names))})", names
         
-        cursor.execute("SELECT * FROM packages WHERE name = ?", (package_name,))
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS selected_names (name TEXT PRIMARY KEY)")
+        cursor.execute("DELETE FROM selected_names")
+        cursor.executemany("INSERT INTO selected_names (name) VALUES (?)", [(name,) for name in names])
+        return "p.name IN (SELECT name FROM selected_names)", []
+    
+    def get_package_files(self, package_name: str) -> Optional[List[str]]:
+        """File list of an installed package, None if it is not installed"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id FROM packages WHERE name = ?", (package_name,))
         row = cursor.fetchone()
         
         if not row:
             return None
         
-        package_data = dict(row)
-        
         cursor.execute("""
-            SELECT dependency_name, dependency_version 
-            FROM dependencies WHERE package_id = ?
-        """, (package_data['id'],))
+            SELECT d.path || f.basename AS file_path FROM files f
+            JOIN directories d ON d.id = f.directory_id
+            WHERE f.package_id = ?
+            ORDER BY file_path
+        """, (row[0],))
+        return [file_row[0] for file_row in cursor.fetchall()]
+    
+    def get_file_owners(self, paths: Iterable[str]) -> Dict[str, List[str]]:
+        """Installed packages owning each path, paths nobody owns are left out
+        Paths match with or without a leading '/'.
+        """
+        # Stored spelling -> every queried spelling it answers
+        variants = {}
+        for path in paths:
+            relative = path.lstrip('/')
+            for stored in (relative, '/' + relative):
+                spellings = variants.setdefault(stored, [])
+                if path not in spellings:
+                    spellings.append(path)
         
-        dependencies = []
-        for dep_row in cursor.fetchall():
-            dep_str = dep_row[0]
-            if dep_row[1]:
-                dep_str += f">={dep_row[1]}"
-            dependencies.append(dep_str)
+        owners = {}
+        cursor = self.conn.cursor()
+        keys = list(variants)
         
-        package_data['dependencies'] = dependencies
+        # Two parameters per path, under SQLite's default limit of 999
+        for start in range(0, len(keys), MAX_INLINE_NAMES // 2):
+            chunk = keys[start:start + MAX_INLINE_NAMES // 2]
+            params = [part for key in chunk for part in self._split_path(key)]
+            cursor.execute(f"""
+                WITH wanted(path, basename) AS (VALUES {', '.join(['(?, ?)'] * len(chunk))})
+                SELECT w.path || w.basename, p.name FROM wanted w
+                JOIN directories d ON d.path = w.path
+                JOIN files f ON f.directory_id = d.id AND f.basename = w.basename
+                JOIN packages p ON p.id = f.package_id
+            """, params)
+            
+            for file_path, name in cursor.fetchall():
+                for path in variants[file_path]:
+                    path_owners = owners.setdefault(path, [])
+                    if name not in path_owners:
+                        path_owners.append(name)
         
+        return owners
+    
+    def get_installed_snapshot(self) -> Dict[str, Dict]:
+        """Resolver view of every installed package in one query
+        name -> {name, version, reason, dependencies, provides, conflicts};
+        file lists are not loaded.
+        """
+        cursor = self.conn.cursor()
         cursor.execute("""
-            SELECT file_path FROM files WHERE package_id = ?
-        """, (package_data['id'],))
-        
-        files = []
-        for file_row in cursor.fetchall():
-            files.append(file_row[0])
-        
-        package_data['files'] = files
+            SELECT p.name, p.version, p.reason,
+                (SELECT group_concat(d.dependency_name || char(31) || coalesce(d.dependency_version, ''), char(30))
+                 FROM dependencies d WHERE d.package_id = p.id),
+                (SELECT group_concat(pr.provide_name, char(30))
+                 FROM provides pr WHERE pr.package_id = p.id),
+                (SELECT group_concat(c.conflict_name, char(30))
+                 FROM conflicts c WHERE c.package_id = p.id)
+            FROM packages p
+        """)
         
-        package_data.setdefault('conflicts', [])
-        package_data.setdefault('provides', [])
+        snapshot = {}
+        for name, version, reason, dependencies, provides, conflicts in cursor.fetchall():
+            snapshot[name] = {
+                'name': name,
+                'version': version,
+                'reason': reason,
+                'dependencies': [
+                    self._join_dependency(*dep.split('\x1f'))
+                    for dep in dependencies.split('\x1e')
+                ] if dependencies else [],
+                'provides': provides.split('\x1e') if provides else [],
+                'conflicts': conflicts.split('\x1e') if conflicts else [],
+            }
         
-        return package_data
+        return snapshot
     
     def list_packages(self) -> List[Dict]:
         """List all packages"""
@@ -215,6 +649,13 @@ class PackageDatabase:
         
         return packages
     
+    def set_reason(self, package_name: str, reason: str) -> bool:
+        """Record why an installed package is installed"""
+        cursor = self.conn.cursor()
+        with self.transaction():
+            cursor.execute("UPDATE packages SET reason = ? WHERE name = ?", (reason, package_name))
+        return cursor.rowcount > 0
+    
     def is_installed(self, package_name: str) -> bool:
         """Is package installed?"""
         cursor = self.conn.cursor()
@@ -222,14 +663,45 @@ class PackageDatabase:
         count = cursor.fetchone()[0]
         return count > 0
     
+    def get_reverse_dependencies(self, package_name: str, recursive: bool = False) -> List[str]:
+        """Names of installed packages that depend on package_name
+        A dependency on a name the package provides counts too, unless
+        another installed package also provides it. With recursive, the
+        packages depending on those are included as well.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"""
+            WITH RECURSIVE rdeps(name) AS (
+                SELECT ?
+                UNION
+                SELECT p.name FROM rdeps r
+                JOIN dependencies d ON d.dependency_name = r.name OR d.dependency_name IN (
+                    SELECT pr.provide_name FROM provides pr
+                    JOIN packages q ON q.id = pr.package_id
+                    WHERE q.name = r.name
+                      AND NOT EXISTS (
+                          SELECT 1 FROM provides other
+                          JOIN packages o ON o.id = other.package_id
+                          WHERE other.provide_name = pr.provide_name AND o.name != r.name
+                      )
+                      AND NOT EXISTS (SELECT 1 FROM packages o WHERE o.name = pr.provide_name)
+                )
+                JOIN packages p ON p.id = d.package_id
+                WHERE p.name != r.name{'' if recursive else ' AND r.name = ?1'}
+            )
+            SELECT name FROM rdeps WHERE name != ?1 ORDER BY name
+        """, (package_name,))
+        
+        return [row[0] for row in cursor.fetchall()]
+    
     def add_repository(self, name: str, url: str, priority: int = 100) -> None:
         """Add repository"""
         cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO repositories (name, url, priority)
-            VALUES (?, ?, ?)
-        """, (name, url, priority))
-        self.conn.commit()
+        with self.transaction():
+            cursor.execute("""
+                INSERT OR REPLACE INTO repositories (name, url, priority)
+                VALUES (?, ?, ?)
+            """, (name, url, priority))
     
     def list_repositories(self) -> List[Dict]:
         """Get repository list"""
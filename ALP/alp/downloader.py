@@ -3,16 +3,32 @@ Package download and verification module
 """
 
 import os
-import requests
 import hashlib
-from typing import Optional, Callable
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Callable
+from urllib.parse import urlparse
+
+from .http_client import get_session
+
+
+# Transfers running at once, overall and against one host
+DEFAULT_JOBS = 16
+DEFAULT_PER_HOST = 8
+
+CHUNK_SIZE = 65536
+
+
+class DownloadCancelled(Exception):
+    """Transfer stopped because the download run was cancelled"""
 
 
 class Downloader:
     """Package downloader"""
     
-    def __init__(self, cache_dir: str = "/var/cache/alp"):
+    def __init__(self, cache_dir: str = "/var/cache/alp", timeout: float = 30):
         self.cache_dir = cache_dir
+        self.timeout = timeout
         self._ensure_cache_dir()
     
     def _ensure_cache_dir(self):
@@ -21,8 +37,13 @@ class Downloader:
             os.makedirs(self.cache_dir, exist_ok=True)
     
     def download(self, url: str, destination: str, 
-                 progress_callback: Optional[Callable] = None) -> bool:
-        """Download file"""
+                 progress_callback: Optional[Callable] = None,
+                 cancel: Optional[threading.Event] = None) -> bool:
+        """Download file
+        HTTP downloads reuse the shared session's connections. Setting
+        cancel stops the transfer at the next chunk; a failed or cancelled
+        download leaves no partial file behind.
+        """
         try:
             if url.startswith('file://'):
                 import shutil
@@ -43,28 +64,45 @@ class Downloader:
                 
                 return True
             else:
-                response = requests.get(url, stream=True)
-                response.raise_for_status()
-                
-                total_size = int(response.headers.get('content-length', 0))
-                downloaded = 0
-                
-                with open(destination, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
+                with get_session().get(url, stream=True, timeout=self.timeout) as response:
+                    response.raise_for_status()
+                    
+                    total_size = int(response.headers.get('content-length', 0))
+                    downloaded = 0
+                    
+                    with open(destination, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            if cancel is not None and cancel.is_set():
+                                raise DownloadCancelled(url)
                             
-                            if progress_callback and total_size > 0:
-                                progress = (downloaded / total_size) * 100
-                                progress_callback(progress, downloaded, total_size)
+                            if chunk:
+                                f.write(chunk)
+                                downloaded += len(chunk)
+                                
+                                if progress_callback and total_size > 0:
+                                    progress = (downloaded / total_size) * 100
+                                    progress_callback(progress, downloaded, total_size)
                 
                 return True
         
+        except DownloadCancelled:
+            self._discard(destination)
+            return False
+        
         except Exception as e:
             print(f"Download error: {e}")
+            self._discard(destination)
             return False
     
+    @staticmethod
+    def _discard(path: str):
+        """Remove a partial download"""
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+    
     def verify_checksum(self, file_path: str, expected_checksum: str) -> bool:
         """Verify checksum"""
         if not os.path.exists(file_path):
@@ -102,3 +140,165 @@ class Downloader:
                     print(f"Deletion error {filename}: {e}")
         
         return count
+
+
+@dataclass
+class DownloadTask:
+    """One file of a DownloadScheduler run"""
+    url: str
+    destination: str
+    size: int = 0           # Expected size, counted until the server reports one
+    checksum: str = ''      # sha256, verified after the transfer when set
+    data: Any = None        # Caller's object, e.g. the package metadata
+
+
+class DownloadScheduler:
+    """
+    Downloads files concurrently over the shared HTTP session
+    
+    At most `jobs` transfers run at once and at most `per_host` of them
+    against one host; tasks of busy hosts wait while others proceed. The
+    first failure cancels the run: queued tasks are dropped, running
+    transfers stop at their next chunk and the error is raised by run().
+    """
+    
+    def __init__(self, downloader: Downloader, jobs: Optional[int] = None,
+                 per_host: Optional[int] = None):
+        self.downloader = downloader
+        self.jobs = max(1, jobs or DEFAULT_JOBS)
+        self.per_host = max(1, per_host or DEFAULT_PER_HOST)
+        self._ready = threading.Condition()
+        self._cancel = threading.Event()
+        self._pending: List[DownloadTask] = []
+        self._active: Dict[str, int] = {}
+        self._received: Dict[int, int] = {}
+        self._sizes: Dict[int, int] = {}
+        self._done = 0
+        self._total = 0
+        self._error: Optional[BaseException] = None
+        self._progress_callback: Optional[Callable] = None
+        self._finish: Optional[Callable] = None
+    
+    def run(self, tasks: List[DownloadTask],
+            progress_callback: Optional[Callable] = None,
+            finish: Optional[Callable] = None) -> None:
+        """
+        Download every task, raising the first error
+        
+        Args:
+            tasks: Files to download
+            progress_callback: progress_callback(done, total, received_bytes,
+                total_bytes) after each chunk and finished task, serialized
+            finish: finish(task) in the worker once a task is downloaded
+                and verified; raising from it fails the run
+        """
+        self._cancel = threading.Event()
+        self._pending = list(tasks)
+        self._active = {}
+        self._received = {}
+        self._sizes = {id(task): task.size or 0 for task in tasks}
+        self._done = 0
+        self._total = len(tasks)
+        self._error = None
+        self._progress_callback = progress_callback
+        self._finish = finish
+        
+        # Room for every transfer one host can get, or urllib3 drops the
+        # surplus connections after each download
+        if any(not task.url.startswith('file://') for task in tasks):
+            get_session(max(self.jobs, self.per_host))
+        
+        workers = [threading.Thread(target=self._work, daemon=True)
+                   for _ in range(min(self.jobs, len(tasks)))]
+        
+        for worker in workers:
+            worker.start()
+        
+        try:
+            for worker in workers:
+                worker.join()
+        except BaseException:
+            # Interrupted while waiting: stop the workers before leaving
+            self.cancel()
+            raise
+        
+        if self._error is not None:
+            raise self._error
+    
+    def cancel(self):
+        """Stop the run: no new transfers, running ones stop at the next chunk"""
+        with self._ready:
+            self._cancel.set()
+            self._pending.clear()
+            self._ready.notify_all()
+    
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).netloc
+    
+    def _next_task(self) -> Optional[DownloadTask]:
+        """Next task whose host has a free slot, None when the run is over"""
+        with self._ready:
+            while True:
+                if self._cancel.is_set() or not self._pending:
+                    return None
+                
+                for position, task in enumerate(self._pending):
+                    host = self._host(task.url)
+                    if self._active.get(host, 0) < self.per_host:
+                        self._active[host] = self._active.get(host, 0) + 1
+                        return self._pending.pop(position)
+                
+                self._ready.wait()
+    
+    def _work(self):
+        """Worker thread: transfer tasks until none are left"""
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            
+            try:
+                self._transfer(task)
+            except BaseException as e:
+                with self._ready:
+                    if self._error is None and not isinstance(e, DownloadCancelled):
+                        self._error = e
+                self.cancel()
+            finally:
+                with self._ready:
+                    self._active[self._host(task.url)] -= 1
+                    self._ready.notify_all()
+    
+    def _transfer(self, task: DownloadTask):
+        """Download, verify and finish one task"""
+        def advance(progress, received, total):
+            with self._ready:
+                self._received[id(task)] = received
+                self._sizes[id(task)] = total
+                self._report()
+        
+        name = os.path.basename(task.destination)
+        
+        if not self.downloader.download(task.url, task.destination, advance, self._cancel):
+            if self._cancel.is_set():
+                raise DownloadCancelled(task.url)
+            raise RuntimeError(f"Download failed: {name}")
+        
+        if task.checksum and not self.downloader.verify_checksum(task.destination, task.checksum):
+            raise ValueError(f"Checksum error: {name}")
+        
+        if self._finish:
+            self._finish(task)
+        
+        with self._ready:
+            self._done += 1
+            self._received[id(task)] = self._sizes[id(task)] = max(
+                self._sizes[id(task)], self._received.get(id(task), 0))
+            self._report()
+    
+    def _report(self):
+        """Aggregate progress to the callback, called with the lock held"""
+        if self._progress_callback and not self._cancel.is_set():
+            self._progress_callback(self._done, self._total,
+                                    sum(self._received.values()), sum(self._sizes.values()))
@@ -0,0 +1,43 @@
+"""
+Shared HTTP session
+Keep-alive connection pools reused by index and package downloads
+requests is imported with the first session, commands that never go to
+the network do not pay for it.
+"""
+
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+
+DEFAULT_POOL_SIZE = 16
+
+_session = None
+_pool_size = 0
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = DEFAULT_POOL_SIZE) -> 'requests.Session':
+    """Process-wide session, a connection pool of at least pool_size per host
+    Asking for a larger pool than the current one remounts the adapters,
+    so callers running more parallel requests keep their connections.
+    """
+    global _session, _pool_size
+
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+
+        if pool_size > _pool_size:
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _pool_size = pool_size
+
+    return _session
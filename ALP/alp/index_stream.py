@@ -0,0 +1,225 @@
+"""
+Compressed index variants and streaming index parsing
+Repositories may publish index.json.zst / .xz / .gz next to index.json;
+downloads are decompressed and parsed chunk by chunk
+"""
+
+import json
+import zlib
+import lzma
+import gzip
+import codecs
+from typing import Dict, List, Optional
+
+try:
+    from compression import zstd as _zstd
+except ImportError:
+    try:
+        import zstandard as _zstd
+    except ImportError:
+        _zstd = None
+
+
+def available_formats() -> List[str]:
+    """Index formats this client can read, most compact first"""
+    formats = []
+    if _zstd is not None:
+        formats.append('json.zst')
+    formats.extend(['json.xz', 'json.gz', 'json'])
+    return formats
+
+
+class _Passthrough:
+    """Decompressor for the uncompressed format"""
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b''
+
+
+def open_decompressor(fmt: str):
+    """Incremental decompressor with decompress() and flush()"""
+    if fmt == 'json':
+        return _Passthrough()
+    if fmt == 'json.gz':
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    if fmt == 'json.xz':
+        return lzma.LZMADecompressor()
+    if fmt == 'json.zst' and _zstd is not None:
+        decompressor = _zstd.ZstdDecompressor()
+        # zstandard streams through decompressobj(), compression.zstd directly
+        if hasattr(decompressor, 'decompressobj'):
+            return decompressor.decompressobj()
+        return decompressor
+    raise ValueError(f"Unsupported index format: {fmt}")
+
+
+def flush_decompressor(decompressor) -> bytes:
+    """Remaining output of a decompressor, if it buffers any"""
+    flush = getattr(decompressor, 'flush', None)
+    return flush() if flush else b''
+
+
+def write_compressed(data: bytes, json_path: str) -> List[str]:
+    """Write every compressed variant of an index file, returns their formats"""
+    formats = []
+
+    with gzip.open(f"{json_path}.gz", 'wb', compresslevel=9) as f:
+        f.write(data)
+    formats.append('json.gz')
+
+    with lzma.open(f"{json_path}.xz", 'wb', preset=6) as f:
+        f.write(data)
+    formats.append('json.xz')
+
+    if _zstd is not None:
+        with open(f"{json_path}.zst", 'wb') as f:
+            f.write(_zstd.compress(data, level=19))
+        formats.append('json.zst')
+
+    return formats
+
+
+class IndexStreamParser:
+    """Incremental parser for an index document
+
+    Top-level fields are decoded as soon as they are complete and each
+    element of the 'packages' array is decoded on its own, so the raw text
+    is never held in full next to the parsed tree.
+    """
+
+    def __init__(self):
+        self.index: Dict = {}
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'start'
+        self._key: Optional[str] = None
+        self._retry_at = 0
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        """Consume a chunk of the document"""
+        self._buffer = self._buffer[self._pos:] + self._text.decode(data, final)
+        self._pos = 0
+
+        if final or len(self._buffer) >= self._retry_at:
+            self._retry_at = 0
+            self._parse(final)
+
+    def close(self) -> Dict:
+        """Finish parsing, returns the index data"""
+        self.feed(b'', final=True)
+
+        if self._state != 'done':
+            raise ValueError("Truncated index document")
+
+        return self.index
+
+    def _decode_value(self, final: bool):
+        """Decode the value at the cursor, raises _Incomplete if cut off"""
+        try:
+            value, end = self._json.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            raise _Incomplete()
+
+        # A number or literal ending the buffer may continue in the next
+        # chunk, and so may a number cut off right before '.', 'e' or 'E'
+        if not final:
+            if end == len(self._buffer):
+                raise _Incomplete()
+            if isinstance(value, (int, float)) and not isinstance(value, bool) \
+               and self._buffer[end] in '.eE':
+                raise _Incomplete()
+
+        self._pos = end
+        return value
+
+    def _expect(self, char: str):
+        """Consume one structural character"""
+        if self._buffer[self._pos] != char:
+            raise ValueError(f"Invalid index document: expected '{char}' at offset {self._pos}")
+        self._pos += 1
+
+    def _parse(self, final: bool):
+        """Advance the state machine as far as the buffer allows"""
+        buffer_len = len(self._buffer)
+
+        while True:
+            while self._pos < buffer_len and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+
+            if self._pos >= buffer_len:
+                return
+
+            char = self._buffer[self._pos]
+            state = self._state
+
+            try:
+                if state == 'start':
+                    self._expect('{')
+                    self._state = 'first_key'
+
+                elif state in ('first_key', 'key'):
+                    if state == 'first_key' and char == '}':
+                        self._pos += 1
+                        self._state = 'done'
+                        continue
+                    key = self._decode_value(final)
+                    if not isinstance(key, str):
+                        raise ValueError("Invalid index document: expected key")
+                    self._key = key
+                    self._state = 'colon'
+
+                elif state == 'colon':
+                    self._expect(':')
+                    self._state = 'packages' if self._key == 'packages' else 'value'
+
+                elif state == 'value':
+                    self.index[self._key] = self._decode_value(final)
+                    self._state = 'next_key'
+
+                elif state == 'next_key':
+                    if char == '}':
+                        self._pos += 1
+                        self._state = 'done'
+                    else:
+                        self._expect(',')
+                        self._state = 'key'
+
+                elif state == 'packages':
+                    self._expect('[')
+                    self.index['packages'] = []
+                    self._state = 'first_item'
+
+                elif state in ('first_item', 'item'):
+                    if state == 'first_item' and char == ']':
+                        self._pos += 1
+                        self._state = 'next_key'
+                        continue
+                    self.index['packages'].append(self._decode_value(final))
+                    self._state = 'next_item'
+
+                elif state == 'next_item':
+                    if char == ']':
+                        self._pos += 1
+                        self._state = 'next_key'
+                    else:
+                        self._expect(',')
+                        self._state = 'item'
+
+                else:
+                    raise ValueError(f"Invalid index document: trailing data at offset {self._pos}")
+
+            except _Incomplete:
+                # Wait until the pending value has had room to double
+                self._retry_at = 2 * (buffer_len - self._pos)
+                return
+
+
+class _Incomplete(Exception):
+    """The value at the cursor continues past the buffered text"""
@@ -4,7 +4,6 @@ Paket format ve işleme modülü
 """
 
 import os
-import yaml
 import tarfile
 import hashlib
 from typing import Dict, List, Optional
@@ -89,6 +88,8 @@ class Package:
         
         metadata = PackageMetadata.from_dict(metadata_dict)
         
+        import yaml
+        
         metadata_path = f"{output_path}.yaml"
         with open(metadata_path, 'w') as f:
             yaml.dump(metadata.to_dict(), f, default_flow_style=False)
@@ -106,6 +107,8 @@ class Package:
     @classmethod
     def load_package(cls, package_path: str) -> 'Package':
         """Mevcut paketi yükle"""
+        import yaml
+        
         with tarfile.open(package_path, "r:gz") as pkg:
             metadata_file = pkg.extractfile("metadata.yaml")
             if metadata_file is None:
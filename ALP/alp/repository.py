@@ -4,18 +4,99 @@ Repository management and package index
 
 import os
 import json
-import requests
-from typing import List, Dict, Optional
+import time
+import zlib
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Sequence, Iterator
+
+from .http_client import get_session
+from .index_stream import (available_formats, open_decompressor, flush_decompressor,
+                           IndexStreamParser)
+from .snapshot import write_snapshot, load_snapshot
+from .search import SearchIndex
+from .version import version_key, best_index
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def package_key(pkg: Dict) -> Tuple[str, str]:
+    """Identity of an index entry"""
+    return pkg.get('name', ''), pkg.get('version', '')
+
+
+def shard_of(name: str, shard_count: int) -> int:
+    """Shard number of a package name in a sharded index"""
+    return zlib.crc32(name.encode('utf-8')) % shard_count
+
+
+def diff_indexes(old_index: Dict, new_index: Dict) -> Dict:
+    """Delta that turns old_index into new_index (revisions not set)"""
+    old_packages = {package_key(pkg): pkg for pkg in old_index.get('packages', [])}
+    new_packages = {package_key(pkg): pkg for pkg in new_index.get('packages', [])}
+    
+    meta = {k: v for k, v in new_index.items()
+            if k not in ('packages', 'revision') and old_index.get(k) != v}
+    
+    return {
+        'meta': meta,
+        'upsert': [pkg for key, pkg in new_packages.items() if old_packages.get(key) != pkg],
+        'remove': [{'name': name, 'version': version}
+                   for name, version in old_packages if (name, version) not in new_packages],
+    }
+
+
+def apply_delta(index_data: Dict, delta: Dict) -> None:
+    """Apply a revision delta to index data in place"""
+    index_data.update(delta.get('meta', {}))
+    
+    removed = {package_key(entry) for entry in delta.get('remove', [])}
+    upserts = {package_key(pkg): pkg for pkg in delta.get('upsert', [])}
+    
+    packages = []
+    for pkg in index_data.get('packages', []):
+        key = package_key(pkg)
+        if key in removed:
+            continue
+        packages.append(upserts.pop(key, pkg))
+    
+    packages.extend(upserts.values())
+    
+    index_data['packages'] = packages
+    index_data['revision'] = delta['revision']
+
+
+@dataclass
+class UpdateResult:
+    """Outcome of one repository index update"""
+    success: bool = True
+    status: str = 'pending'
+    elapsed: float = 0.0
+    bytes: int = 0
+    error: Optional[str] = None
+    deadline: Optional[float] = None    # time.monotonic() the update must end by
 
 
 class Repository:
     """Repository class"""
     
-    def __init__(self, database, cache_dir: str = "/var/cache/alp/repos"):
+    def __init__(self, database, cache_dir: str = "/var/cache/alp/repos", timeout: float = 30):
         self.database = database
         self.cache_dir = cache_dir
+        self.timeout = timeout
+        self._state_lock = threading.Lock()
         self._ensure_cache_dir()
         self._index_cache = {}
+        self._package_index = None
+        self._providers_index = {}
+        self._sharded_repos = []
+        self._candidate_groups = {}
+        self._shard_manifests = {}
+        self._shard_cache = {}
+        self._search_index = None
     
     def _ensure_cache_dir(self):
         """Create cache directory"""
@@ -24,87 +105,666 @@ class Repository:
     
     def update_index(self, repo_url: str) -> bool:
         """Update repository index"""
+        result = self.refresh_index(repo_url)
+        
+        if not result.success:
+            print(f"Index update error: {result.error}")
+        
+        return result.success
+    
+    def refresh_index(self, repo_url: str, timeout: Optional[float] = None) -> UpdateResult:
+        """Update repository index and report how
+        Tries the delta chain first when the repository publishes one, then
+        a conditional fetch of the full index. timeout (seconds) bounds the
+        whole update, every request and received chunk included; each
+        request also times out after self.timeout.
+        """
+        result = UpdateResult()
+        started = time.monotonic()
+        request_timeout = self.timeout
+        
+        if timeout:
+            result.deadline = started + timeout
+        
         try:
-            index_url = f"{repo_url}/index.json"
+            state = self._load_repo_state().get(repo_url, {})
+            manifest = self._fetch_manifest(repo_url, request_timeout, result)
+            
+            if manifest and manifest.get('shards'):
+                self._update_shard_manifest(repo_url, state, manifest, result, request_timeout)
+                return result
             
-            if repo_url.startswith('file://'):
-                file_path = repo_url.replace('file://', '') + '/index.json'
-                with open(file_path, 'r') as f:
-                    index_data = json.load(f)
+            try:
+                if manifest and self._update_from_deltas(repo_url, state, manifest, result, request_timeout):
+                    return result
+            except Exception as e:
+                print(f"Delta update error, fetching full index: {e}")
+            
+            for fmt in self._index_formats(state, manifest):
+                headers = {}
+                if fmt == state.get('format') and self._cache_exists(state.get('name')):
+                    if state.get('etag'):
+                        headers['If-None-Match'] = state['etag']
+                    if state.get('last_modified'):
+                        headers['If-Modified-Since'] = state['last_modified']
+                
+                status, index_data, response_headers = self._download_index(
+                    repo_url, fmt, headers, request_timeout, result
+                )
+                
+                # Listed but not there (404, or 403 on hosts hiding missing objects)
+                if 400 <= status < 500:
+                    continue
+                
+                if status == 304:
+                    result.status = 'not_modified'
+                    return result
+                
+                self._save_repo_state(repo_url, {
+                    'name': index_data.get('name', 'unknown'),
+                    'format': fmt,
+                    'etag': response_headers.get('ETag'),
+                    'last_modified': response_headers.get('Last-Modified'),
+                    'revision': index_data.get('revision'),
+                })
+                break
             else:
-                response = requests.get(index_url, timeout=30)
-                response.raise_for_status()
-                index_data = response.json()
+                raise RuntimeError(f"index.json not found: {repo_url}")
+            
+            result.status = 'updated'
+            return result
+        
+        except Exception as e:
+            result.success = False
+            result.status = 'failed'
+            result.error = str(e)
+            return result
+        
+        finally:
+            result.elapsed = time.monotonic() - started
+    
+    def _update_from_deltas(self, repo_url: str, state: Dict, manifest: Dict,
+                            result: UpdateResult, timeout: float) -> bool:
+        """Bring the cached index up to date from published deltas
+        Returns False when a full fetch is needed.
+        """
+        revision = state.get('revision')
+        
+        if revision is None or not self._cache_exists(state.get('name')):
+            return False
+        
+        latest = manifest.get('revision')
+        
+        if latest == revision:
+            result.status = 'not_modified'
+            return True
+        
+        if latest is None or not manifest.get('oldest_delta', latest) <= revision < latest:
+            return False
+        
+        with open(os.path.join(self.cache_dir, f"{state['name']}.json"), 'r') as f:
+            index_data = json.load(f)
+        
+        while revision < latest:
+            status, body, _ = self._fetch(f"{repo_url}/deltas/{revision}.json", None, timeout, result)
+            
+            if status != 200:
+                return False
+            
+            delta = json.loads(body)
+            if delta.get('from_revision') != revision:
+                return False
+            
+            apply_delta(index_data, delta)
+            revision = index_data['revision']
+        
+        self._store_index(index_data)
+        self._save_repo_state(repo_url, {
+            'name': index_data.get('name', 'unknown'),
+            'revision': revision,
+        })
+        
+        result.status = 'delta'
+        return True
+    
+    def _update_shard_manifest(self, repo_url: str, state: Dict, manifest: Dict,
+                               result: UpdateResult, timeout: float):
+        """Refresh the shard manifest of a sharded repository
+        Shards themselves are fetched on first lookup; cached shards whose
+        hash is unchanged are kept.
+        """
+        repo_name = state.get('name')
+        
+        if state.get('sharded') and state.get('revision') == manifest.get('revision') \
+           and repo_name and os.path.exists(self._shard_manifest_path(repo_name)):
+            result.status = 'not_modified'
+            return
+        
+        status, body, _ = self._fetch(f"{repo_url}/{manifest['shards']}", None, timeout, result)
+        
+        if status != 200:
+            raise RuntimeError(f"Shard manifest not found: {repo_url}")
+        
+        shard_manifest = json.loads(body)
+        self._store_shard_manifest(shard_manifest)
+        self._save_repo_state(repo_url, {
+            'name': shard_manifest.get('name', 'unknown'),
+            'revision': shard_manifest.get('revision'),
+            'sharded': True,
+        })
+        
+        result.status = 'updated'
+    
+    def _store_shard_manifest(self, shard_manifest: Dict):
+        """Write shard manifest to the cache, dropping superseded data
+        A cached full index of the repository and shards no longer listed
+        are removed.
+        """
+        repo_name = shard_manifest.get('name', 'unknown')
+        manifest_path = self._shard_manifest_path(repo_name)
+        
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(shard_manifest, f)
+        os.replace(tmp_path, manifest_path)
+        
+        for path in (os.path.join(self.cache_dir, f"{repo_name}.json"), self._snapshot_path(repo_name)):
+            if os.path.exists(path):
+                os.remove(path)
+        
+        shard_dir = self._shard_dir(repo_name)
+        if os.path.isdir(shard_dir):
+            current = {shard['sha256'] for shard in shard_manifest.get('shards', [])}
+            for filename in os.listdir(shard_dir):
+                if filename.split('.')[0] not in current:
+                    os.remove(os.path.join(shard_dir, filename))
+        
+        self._index_cache.pop(repo_name, None)
+        self._shard_manifests[repo_name] = shard_manifest
+        self._shard_cache = {key: value for key, value in self._shard_cache.items()
+                             if key[0] != repo_name}
+        self.invalidate_package_index()
+    
+    def _fetch_manifest(self, repo_url: str, timeout: float,
+                        result: UpdateResult) -> Optional[Dict]:
+        """Repository revision.json, None if not published
+        The manifest is optional: any error fetching or reading it (many
+        static hosts answer 403 for missing objects) means a full fetch.
+        """
+        try:
+            status, body, _ = self._fetch(f"{repo_url}/revision.json", None, timeout, result)
+            
+            if status != 200:
+                return None
             
-            repo_name = index_data.get('name', 'unknown')
-            cache_file = os.path.join(self.cache_dir, f"{repo_name}.json")
+            return json.loads(body)
+        except Exception:
+            return None
+    
+    @staticmethod
+    def _index_formats(state: Dict, manifest: Optional[Dict]) -> List[str]:
+        """Index variants to try, the previously used one first
+        Compressed variants are only requested when revision.json lists
+        them, otherwise plain index.json is fetched directly.
+        """
+        published = {'json'}
+        if manifest and 'formats' in manifest:
+            published.update(manifest['formats'])
+        
+        formats = [fmt for fmt in available_formats() if fmt in published]
+        
+        if state.get('format') in formats:
+            formats.remove(state['format'])
+            formats.insert(0, state['format'])
+        
+        return formats
+    
+    def _download_index(self, repo_url: str, fmt: str, headers: Dict, timeout: float,
+                        result: UpdateResult) -> Tuple[int, Optional[Dict], Dict]:
+        """Stream an index variant into the cache
+        The body is decompressed and parsed chunk by chunk while the
+        decompressed JSON is written to the cache.
+        """
+        status, chunks, response_headers = self._fetch_stream(
+            f"{repo_url}/index.{fmt}", headers, timeout, result
+        )
+        
+        if status != 200:
+            return status, None, response_headers
+        
+        tmp_path = os.path.join(self.cache_dir, f".index-{threading.get_ident()}.part")
+        decompressor = open_decompressor(fmt)
+        parser = IndexStreamParser()
+        
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    data = decompressor.decompress(chunk)
+                    f.write(data)
+                    parser.feed(data)
+                
+                data = flush_decompressor(decompressor)
+                f.write(data)
+                parser.feed(data)
             
+            index_data = parser.close()
+            self._store_index(index_data, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        return status, index_data, response_headers
+    
+    def _store_index(self, index_data: Dict, source_path: Optional[str] = None):
+        """Write index to the cache and refresh derived structures
+        source_path, if given, already holds the index JSON and is moved
+        into place.
+        """
+        repo_name = index_data.get('name', 'unknown')
+        cache_file = os.path.join(self.cache_dir, f"{repo_name}.json")
+        
+        if source_path:
+            os.replace(source_path, cache_file)
+        else:
             with open(cache_file, 'w') as f:
                 json.dump(index_data, f, indent=2)
+        
+        shard_manifest_path = self._shard_manifest_path(repo_name)
+        if os.path.exists(shard_manifest_path):
+            os.remove(shard_manifest_path)
+        self._shard_manifests.pop(repo_name, None)
+        
+        self._write_snapshot(repo_name, index_data)
+        self._index_cache[repo_name] = index_data
+        self.invalidate_package_index()
+    
+    def _fetch(self, url: str, headers: Optional[Dict] = None, timeout: Optional[float] = None,
+               result: Optional[UpdateResult] = None) -> Tuple[int, Optional[bytes], Dict]:
+        """GET url, returns (status, body, headers)
+        304 and client errors (4xx) are returned instead of raised.
+        """
+        status, chunks, response_headers = self._fetch_stream(url, headers, timeout, result)
+        
+        if status != 200:
+            return status, None, response_headers
+        
+        return status, b''.join(chunks), response_headers
+    
+    def _fetch_stream(self, url: str, headers: Optional[Dict] = None, timeout: Optional[float] = None,
+                      result: Optional[UpdateResult] = None) -> Tuple[int, Iterator[bytes], Dict]:
+        """Streaming GET, returns (status, body chunks, headers)
+        headers is case-insensitive, servers spell ETag differently.
+        304 and client errors (4xx) are returned instead of raised: missing
+        objects give 404 or, on hosts hiding them, 403. file:// URLs get an
+        ETag from size and mtime so conditional requests work for them too.
+        Received bytes are added to result.
+        """
+        headers = headers or {}
+        timeout = timeout or self.timeout
+        
+        if result is not None and result.deadline is not None:
+            timeout = min(timeout, self._time_left(result, url))
+        
+        def counted(chunks):
+            for chunk in chunks:
+                if result is not None:
+                    result.bytes += len(chunk)
+                    if result.deadline is not None:
+                        self._time_left(result, url)
+                yield chunk
+        
+        if url.startswith('file://'):
+            from requests.structures import CaseInsensitiveDict
             
-            self._index_cache[repo_name] = index_data
+            file_path = url.replace('file://', '')
             
-            return True
+            if not os.path.exists(file_path):
+                return 404, iter([]), CaseInsensitiveDict()
+            
+            stat = os.stat(file_path)
+            etag = f'"{stat.st_size}-{stat.st_mtime_ns}"'
+            
+            if headers.get('If-None-Match') == etag:
+                return 304, iter([]), CaseInsensitiveDict({'ETag': etag})
+            
+            def read_file():
+                with open(file_path, 'rb') as f:
+                    yield from iter(lambda: f.read(STREAM_CHUNK_SIZE), b'')
+            
+            return 200, counted(read_file()), CaseInsensitiveDict({'ETag': etag})
         
-        except Exception as e:
-            print(f"Index update error: {e}")
+        response = get_session().get(url, headers=headers, timeout=timeout, stream=True)
+        
+        if response.status_code == 304 or 400 <= response.status_code < 500:
+            response.close()
+            return response.status_code, iter([]), response.headers
+        
+        response.raise_for_status()
+        
+        def read_response():
+            with response:
+                # read1 returns after one socket read, so the deadline is
+                # checked even while a server trickles bytes
+                read1 = getattr(response.raw, 'read1', None)
+                
+                if read1 is None:
+                    yield from response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+                    return
+                
+                while True:
+                    chunk = read1(STREAM_CHUNK_SIZE, decode_content=True)
+                    if not chunk:
+                        return
+                    yield chunk
+        
+        return response.status_code, counted(read_response()), response.headers
+    
+    @staticmethod
+    def _time_left(result: UpdateResult, url: str) -> float:
+        """Seconds left until result.deadline, raises TimeoutError past it"""
+        remaining = result.deadline - time.monotonic()
+        
+        if remaining <= 0:
+            raise TimeoutError(f"Repository update timed out: {url}")
+        
+        return remaining
+    
+    def _cache_exists(self, repo_name: Optional[str]) -> bool:
+        """Is there a cached index for the repository?"""
+        if not repo_name:
             return False
+        
+        return os.path.exists(os.path.join(self.cache_dir, f"{repo_name}.json"))
+    
+    def _repo_state_path(self) -> str:
+        """Per-repository fetch state path (validators and index revision)"""
+        return os.path.join(self.cache_dir, "repo_state.json")
+    
+    def _load_repo_state(self) -> Dict[str, Dict]:
+        """Fetch state of all repositories, keyed by URL"""
+        try:
+            with open(self._repo_state_path(), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
     
-    def update_all_indexes(self) -> Dict[str, bool]:
-        """Update all repository indexes"""
+    def _save_repo_state(self, repo_url: str, state: Dict):
+        """Record fetch state of a repository"""
+        with self._state_lock:
+            all_state = self._load_repo_state()
+            all_state[repo_url] = {k: v for k, v in state.items() if v is not None}
+            
+            tmp_path = f"{self._repo_state_path()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(all_state, f, indent=2)
+            os.replace(tmp_path, self._repo_state_path())
+    
+    def update_all_indexes(self, max_workers: int = 8,
+                           timeout: Optional[float] = None) -> Dict[str, UpdateResult]:
+        """Update all repository indexes concurrently
+        At most max_workers repositories are fetched at once; timeout
+        bounds each repository's whole update (see refresh_index).
+        """
         repos = self.database.list_repositories()
         results = {}
         
-        for repo in repos:
-            success = self.update_index(repo['url'])
-            results[repo['name']] = success
+        if repos:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(repos)))) as executor:
+                futures = {
+                    repo['name']: executor.submit(self.refresh_index, repo['url'], timeout)
+                    for repo in repos
+                }
+                
+                for repo_name, future in futures.items():
+                    results[repo_name] = future.result()
+        
+        self.prepare_search_index()
         
         return results
     
-    def search_package(self, query: str) -> List[Dict]:
+    def search_package(self, query: str, limit: Optional[int] = None) -> List[Dict]:
         """Search for package"""
-        results = []
+        search_index = self._get_search_index()
+        
+        if search_index is None:
+            return []
+        
+        return search_index.search(query, limit)
+    
+    def prepare_search_index(self):
+        """Rebuild the search index after an update if an index changed
+        Skipped when a repository is sharded, as that would fetch all of its
+        shards; the index is then built on the first search.
+        """
+        repos = self.database.list_repositories()
+        
+        if not any(self._load_shard_manifest(repo['name']) for repo in repos):
+            self._get_search_index()
+    
+    def rebuild_search_index(self) -> Optional[SearchIndex]:
+        """Build and persist the search index of all enabled repositories"""
         repos = self.database.list_repositories()
+        sources = self._search_sources(repos)
+        
+        def entries():
+            for repo in repos:
+                for pkg in self._iter_packages(repo):
+                    yield repo['name'], pkg
+        
+        self._search_index = SearchIndex.build(entries(), sources)
+        
+        try:
+            self._search_index.save(self._search_index_path())
+        except Exception as e:
+            print(f"Search index save error: {e}")
+        
+        return self._search_index
+    
+    def _get_search_index(self) -> Optional[SearchIndex]:
+        """Persisted search index, rebuilt when repository indexes changed"""
+        sources = self._search_sources(self.database.list_repositories())
+        
+        if self._search_index is not None and self._search_index.sources == sources:
+            return self._search_index
+        
+        search_index = SearchIndex.load(self._search_index_path())
+        
+        if search_index is not None and search_index.sources == sources:
+            self._search_index = search_index
+            return search_index
+        
+        return self.rebuild_search_index()
+    
+    def _search_index_path(self) -> str:
+        """Persisted search index path"""
+        return os.path.join(self.cache_dir, "search.idx")
+    
+    def _search_sources(self, repos: List[Dict]) -> List[List]:
+        """Repository name, priority and cached index stat, in priority order"""
+        sources = []
         
         for repo in repos:
-            index = self._load_index(repo['name'])
-            
-            if not index:
-                continue
-            
-            packages = index.get('packages', [])
-            
-            for pkg in packages:
-                if query.lower() in pkg.get('name', '').lower() or \
-                   query.lower() in pkg.get('description', '').lower():
-                    pkg['repository'] = repo['name']
-                    results.append(pkg)
+            cache_file = os.path.join(self.cache_dir, f"{repo['name']}.json")
+            if not os.path.exists(cache_file):
+                cache_file = self._shard_manifest_path(repo['name'])
+            if os.path.exists(cache_file):
+                stat = os.stat(cache_file)
+                sources.append([repo['name'], repo['priority'], stat.st_size, stat.st_mtime_ns])
         
-        return results
+        return sources
     
     def get_package_metadata(self, package_name: str) -> Optional[Dict]:
-        """Get package metadata"""
+        """Get metadata of the newest version in the highest priority repository"""
+        return self.find_best_candidate(package_name)
+    
+    def find_best_candidate(self, package_name: str, op: Optional[str] = None,
+                            version: Optional[str] = None) -> Optional[Dict]:
+        """Newest version satisfying 'op version', repositories tried by priority"""
+        for repo, keys, entries in self._get_candidate_groups(package_name):
+            position = best_index(keys, op, version)
+            if position is not None:
+                return self._make_candidate(repo, *entries[position])
+        
+        return None
+    
+    def get_candidates(self, package_name: str) -> List[Dict]:
+        """All available versions, by repository priority then newest first"""
+        candidates = []
+        
+        for repo, _, entries in self._get_candidate_groups(package_name):
+            for packages, position in reversed(entries):
+                candidates.append(self._make_candidate(repo, packages, position))
+        
+        return candidates
+    
+    def find_providers(self, name: str) -> List[str]:
+        """Names of available packages that provide name, by repository priority"""
+        self._get_package_index()
+        providers = list(self._providers_index.get(name, []))
+        
+        for repo in self._sharded_repos:
+            shard_manifest = self._load_shard_manifest(repo['name']) or {}
+            for provider in shard_manifest.get('provides', {}).get(name, []):
+                if provider not in providers:
+                    providers.append(provider)
+        
+        return providers
+    
+    def invalidate_package_index(self):
+        """Drop the merged package index, it is rebuilt on next lookup"""
+        self._package_index = None
+        self._providers_index = {}
+        self._sharded_repos = []
+        self._candidate_groups = {}
+    
+    def index_fingerprint(self) -> str:
+        """Hash of the enabled repositories and their cached indexes
+        Changes whenever an index is updated, a repository is added or
+        removed, or priorities change.
+        """
+        state = self._load_repo_state()
+        entries = []
+        
+        for repo in self.database.list_repositories():
+            files = []
+            for path in (os.path.join(self.cache_dir, f"{repo['name']}.json"),
+                         self._shard_manifest_path(repo['name'])):
+                try:
+                    stat = os.stat(path)
+                    files.append([stat.st_size, stat.st_mtime_ns])
+                except OSError:
+                    files.append(None)
+            
+            entries.append([repo['name'], repo['url'], repo['priority'],
+                            state.get(repo['url'], {}).get('revision'), files])
+        
+        return hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()
+    
+    def _get_package_index(self) -> Dict[str, List[Tuple[Dict, Sequence, int, str]]]:
+        """Merged name -> [(repo, packages, position, version)] index over all enabled repositories
+        Entries of each name are ordered by repository priority.
+        """
+        if self._package_index is None:
+            self._package_index, self._providers_index, self._sharded_repos = self._build_package_index()
+            self._candidate_groups = {}
+        
+        return self._package_index
+    
+    def _build_package_index(self) -> Tuple[Dict[str, List[Tuple[Dict, Sequence, int, str]]],
+                                            Dict[str, List[str]], List[Dict]]:
+        """Build the merged package index and the provided name -> providers index
+        Sharded repositories are only listed; their packages are looked up
+        shard by shard and their providers in the shard manifest.
+        """
+        package_index = {}
+        providers_index = {}
+        sharded_repos = []
         repos = self.database.list_repositories()
         
         for repo in repos:
+            shard_manifest = self._load_shard_manifest(repo['name'])
+            
+            if shard_manifest is not None:
+                sharded_repos.append(repo)
+                continue
+            
             index = self._load_index(repo['name'])
             
             if not index:
                 continue
             
             packages = index.get('packages', [])
+            names = getattr(packages, 'names', None)
+            versions = getattr(packages, 'versions', None)
+            provides = getattr(packages, 'provides', None)
+            if names is None:
+                names = [pkg.get('name') for pkg in packages]
+                versions = [pkg.get('version', '') for pkg in packages]
+                provides = [pkg.get('provides', []) or [] for pkg in packages]
             
-            for pkg in packages:
-                if pkg.get('name') == package_name:
-                    pkg['repository'] = repo['name']
-                    pkg['repository_url'] = repo['url']
-                    return pkg
+            for position, name in enumerate(names):
+                if not name:
+                    continue
+                
+                package_index.setdefault(name, []).append(
+                    (repo, packages, position, versions[position])
+                )
+                
+                for provided in provides[position]:
+                    providers = providers_index.setdefault(provided, [])
+                    if name not in providers:
+                        providers.append(name)
         
-        return None
+        return package_index, providers_index, sharded_repos
+    
+    def _get_candidate_groups(self, package_name: str) -> List[Tuple[Dict, List[Tuple], List[Tuple[Sequence, int]]]]:
+        """Versions of a package grouped per repository, in priority order
+        Each group holds ascending version keys and the matching (packages, position)
+        entries, sorted once on first lookup of the name.
+        """
+        package_index = self._get_package_index()
+        
+        groups = self._candidate_groups.get(package_name)
+        if groups is not None:
+            return groups
+        
+        entries = list(package_index.get(package_name, []))
+        for repo in self._sharded_repos:
+            entries.extend(self._shard_entries(repo, package_name))
+        
+        if not entries:
+            return []
+        
+        if self._sharded_repos:
+            entries.sort(key=lambda entry: -entry[0]['priority'])
+        
+        by_repo = {}
+        for repo, packages, position, version in entries:
+            if repo['name'] not in by_repo:
+                by_repo[repo['name']] = (repo, [])
+            by_repo[repo['name']][1].append((version_key(version), packages, position))
+        
+        # dicts keep insertion order, so groups stay in repository priority order
+        groups = []
+        for repo, versions in by_repo.values():
+            versions.sort(key=lambda item: item[0])
+            keys = [key for key, _, _ in versions]
+            groups.append((repo, keys, [(packages, position) for _, packages, position in versions]))
+        
+        self._candidate_groups[package_name] = groups
+        return groups
+    
+    @staticmethod
+    def _make_candidate(repo: Dict, packages: Sequence, position: int) -> Dict:
+        """Copy index entry annotated with its repository"""
+        candidate = dict(packages[position])
+        candidate['repository'] = repo['name']
+        candidate['repository_url'] = repo['url']
+        return candidate
     
     def get_package_url(self, package_name: str, version: str) -> Optional[str]:
         """Get package download URL"""
-        metadata = self.get_package_metadata(package_name)
+        metadata = self.find_best_candidate(package_name, '=', version)
         
         if not metadata:
             return None
@@ -116,8 +776,162 @@ class Repository:
         
         return f"{repo_url}/packages/{package_name}-{version}.alp"
     
+    def get_package_files(self, metadata: Dict) -> List[str]:
+        """File list of a package
+        Slim indexes keep file lists in per-package manifests; they are
+        fetched on demand and cached.
+        """
+        if 'files' in metadata:
+            return metadata['files']
+        
+        repo_name = metadata.get('repository', 'unknown')
+        file_name = f"{metadata['name']}-{metadata['version']}.json"
+        cache_file = os.path.join(self.cache_dir, 'manifests', repo_name, file_name)
+        
+        if os.path.exists(cache_file):
+            with open(cache_file, 'r') as f:
+                return json.load(f).get('files', [])
+        
+        index = self._load_shard_manifest(repo_name) or self._load_index(repo_name) or {}
+        manifests_dir = index.get('manifests', 'manifests')
+        status, body, _ = self._fetch(f"{metadata['repository_url']}/{manifests_dir}/{file_name}")
+        
+        if status != 200:
+            raise RuntimeError(f"File manifest not found: {metadata['name']}-{metadata['version']}")
+        
+        manifest = json.loads(body)
+        
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, 'wb') as f:
+            f.write(body)
+        
+        return manifest.get('files', [])
+    
+    def _shard_manifest_path(self, repo_name: str) -> str:
+        """Cached shard manifest path of a sharded repository"""
+        return os.path.join(self.cache_dir, f"{repo_name}.shards.json")
+    
+    def _shard_dir(self, repo_name: str) -> str:
+        """Cached shards directory of a sharded repository"""
+        return os.path.join(self.cache_dir, 'shards', repo_name)
+    
+    def _load_shard_manifest(self, repo_name: str) -> Optional[Dict]:
+        """Cached shard manifest, None if the repository is not sharded"""
+        if repo_name in self._shard_manifests:
+            return self._shard_manifests[repo_name]
+        
+        manifest_path = self._shard_manifest_path(repo_name)
+        
+        if not os.path.exists(manifest_path):
+            return None
+        
+        try:
+            with open(manifest_path, 'r') as f:
+                shard_manifest = json.load(f)
+        except Exception as e:
+            print(f"Shard manifest load error: {e}")
+            return None
+        
+        self._shard_manifests[repo_name] = shard_manifest
+        return shard_manifest
+    
+    def _shard_entries(self, repo: Dict, package_name: str) -> List[Tuple[Dict, Sequence, int, str]]:
+        """Package index entries of a name in a sharded repository"""
+        shard_manifest = self._load_shard_manifest(repo['name'])
+        
+        if not shard_manifest or not shard_manifest.get('shards'):
+            return []
+        
+        shard = self._load_shard(repo, shard_of(package_name, len(shard_manifest['shards'])))
+        
+        if shard is None:
+            return []
+        
+        packages, positions = shard
+        versions = getattr(packages, 'versions', None)
+        
+        return [
+            (repo, packages, position,
+             versions[position] if versions is not None else packages[position].get('version', ''))
+            for position in positions.get(package_name, [])
+        ]
+    
+    def _load_shard(self, repo: Dict, number: int) -> Optional[Tuple[Sequence, Dict[str, List[int]]]]:
+        """Packages of one shard and their name -> positions map
+        The shard is downloaded when no cached copy with the published
+        hash exists, and served from its snapshot afterwards.
+        """
+        key = (repo['name'], number)
+        
+        if key in self._shard_cache:
+            return self._shard_cache[key]
+        
+        shard_manifest = self._load_shard_manifest(repo['name'])
+        shard = shard_manifest['shards'][number]
+        shard_dir = self._shard_dir(repo['name'])
+        cache_file = os.path.join(shard_dir, f"{shard['sha256']}.json")
+        snapshot_path = os.path.join(shard_dir, f"{shard['sha256']}.snap")
+        
+        try:
+            if not os.path.exists(cache_file):
+                url = f"{repo['url']}/{shard_manifest.get('shard_dir', 'shards')}/{shard['file']}"
+                status, body, _ = self._fetch(url)
+                
+                if status != 200:
+                    raise RuntimeError(f"Index shard not found: {url}")
+                
+                if hashlib.sha256(body).hexdigest() != shard['sha256']:
+                    raise RuntimeError(f"Index shard checksum mismatch: {url}")
+                
+                os.makedirs(shard_dir, exist_ok=True)
+                tmp_path = f"{cache_file}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, cache_file)
+            
+            snapshot = load_snapshot(snapshot_path, cache_file)
+            if snapshot is not None:
+                packages = snapshot
+            else:
+                with open(cache_file, 'r') as f:
+                    shard_data = json.load(f)
+                write_snapshot(shard_data, snapshot_path, cache_file)
+                packages = shard_data.get('packages', [])
+        except Exception as e:
+            print(f"Index shard error: {e}")
+            return None
+        
+        names = getattr(packages, 'names', None)
+        if names is None:
+            names = [pkg.get('name') for pkg in packages]
+        
+        positions = {}
+        for position, name in enumerate(names):
+            positions.setdefault(name, []).append(position)
+        
+        self._shard_cache[key] = (packages, positions)
+        return self._shard_cache[key]
+    
+    def _iter_packages(self, repo: Dict) -> Iterator[Dict]:
+        """All packages of a repository, every shard of a sharded one"""
+        shard_manifest = self._load_shard_manifest(repo['name'])
+        
+        if shard_manifest is None:
+            index = self._load_index(repo['name'])
+            if index:
+                yield from index.get('packages', [])
+            return
+        
+        for number in range(len(shard_manifest.get('shards', []))):
+            shard = self._load_shard(repo, number)
+            if shard is not None:
+                yield from shard[0]
+    
     def _load_index(self, repo_name: str) -> Optional[Dict]:
-        """Load repository index"""
+        """Load repository index
+        Served from the compiled snapshot, which is rebuilt when the
+        cached JSON changes.
+        """
         if repo_name in self._index_cache:
             return self._index_cache[repo_name]
         
@@ -126,14 +940,35 @@ class Repository:
         if not os.path.exists(cache_file):
             return None
         
+        snapshot = load_snapshot(self._snapshot_path(repo_name), cache_file)
+        if snapshot is not None:
+            index_data = snapshot.to_index()
+            self._index_cache[repo_name] = index_data
+            return index_data
+        
         try:
             with open(cache_file, 'r') as f:
                 index_data = json.load(f)
-                self._index_cache[repo_name] = index_data
-                return index_data
         except Exception as e:
             print(f"Index load error: {e}")
             return None
+        
+        self._write_snapshot(repo_name, index_data)
+        self._index_cache[repo_name] = index_data
+        return index_data
+    
+    def _snapshot_path(self, repo_name: str) -> str:
+        """Compiled snapshot path of a repository index"""
+        return os.path.join(self.cache_dir, f"{repo_name}.snap")
+    
+    def _write_snapshot(self, repo_name: str, index_data: Dict):
+        """Compile cached index into its snapshot, failures are not fatal"""
+        cache_file = os.path.join(self.cache_dir, f"{repo_name}.json")
+        
+        try:
+            write_snapshot(index_data, self._snapshot_path(repo_name), cache_file)
+        except Exception as e:
+            print(f"Index snapshot error: {e}")
     
     def list_available_packages(self) -> List[Dict]:
         """List all available packages"""
@@ -141,14 +976,7 @@ class Repository:
         repos = self.database.list_repositories()
         
         for repo in repos:
-            index = self._load_index(repo['name'])
-            
-            if not index:
-                continue
-            
-            packages = index.get('packages', [])
-            
-            for pkg in packages:
+            for pkg in self._iter_packages(repo):
                 pkg['repository'] = repo['name']
                 all_packages.append(pkg)
         
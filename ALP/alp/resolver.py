@@ -3,8 +3,72 @@ Bağımlılık çözümleme motoru
 Hızlı ve akıllı dependency resolution
 """
 
-from typing import List, Dict, Set, Optional, Tuple
-from collections import defaultdict, deque
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Set, Optional, Tuple
+from collections import defaultdict
+
+from .version import compare_versions, parse_constraint
+from .solver import Solver, SolverTimeout
+from .database import REASON_DEPENDENCY
+
+
+# Çözüm önbelleği biçimi; değişince eski kayıtlar kullanılmaz
+RESOLVE_CACHE_VERSION = 3
+
+# Önbellek dizininde tutulan en fazla çözüm sayısı
+RESOLVE_CACHE_ENTRIES = 256
+
+
+def _components(edges: List[Set[int]]) -> List[List[int]]:
+    """Güçlü bağlı bileşenler (Tarjan, özyinelemesiz)
+    Bir bileşen, bağımlı olduğu tüm bileşenlerden sonra döner.
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    
+    for root in range(len(edges)):
+        if root in index:
+            continue
+        
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(sorted(edges[root])))]
+        
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(edges[child]))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(sorted(component))
+    
+    return components
 
 
 class DependencyResolver:
@@ -18,177 +82,288 @@ class DependencyResolver:
     def parse_dependency(self, dep_string: str) -> Tuple[str, Optional[str]]:
         """Bağımlılık stringini parse et
         Örnek: 'gcc>=11.0' -> ('gcc', '11.0')
+        Birden fazla kısıt varsa ilkinin sürümü döner; tüm kısıtlar için
+        alp.version.parse_constraint kullanılır.
         """
-        if '>=' in dep_string:
-            parts = dep_string.split('>=')
-            return parts[0].strip(), parts[1].strip()
-        elif '=' in dep_string:
-            parts = dep_string.split('=')
-            return parts[0].strip(), parts[1].strip()
-        else:
+        try:
+            name, constraints = parse_constraint(dep_string)
+        except ValueError:
             return dep_string.strip(), None
+        
+        return name, constraints[0][1] if constraints else None
     
     def compare_versions(self, version1: str, version2: str) -> int:
         """Versiyon karşılaştırma
+        Epoch, ön sürüm ('~', '-rc1') ve harf içeren sürümleri destekler;
+        her sürüm bir kez ayrıştırılıp önbelleğe alınır (bkz. alp.version).
         Returns: -1 if v1 < v2, 0 if equal, 1 if v1 > v2
         """
-        v1_parts = [int(x) for x in version1.split('.')]
-        v2_parts = [int(x) for x in version2.split('.')]
-        
-        max_len = max(len(v1_parts), len(v2_parts))
-        v1_parts.extend([0] * (max_len - len(v1_parts)))
-        v2_parts.extend([0] * (max_len - len(v2_parts)))
-        
-        for i in range(max_len):
-            if v1_parts[i] < v2_parts[i]:
-                return -1
-            elif v1_parts[i] > v2_parts[i]:
-                return 1
-        
-        return 0
+        return compare_versions(version1, version2)
     
-    def resolve(self, package_names: List[str]) -> Dict:
+    def resolve(self, package_names: List[str], time_budget: float = 10.0) -> Dict:
         """Ana çözümleme fonksiyonu
+        Tüm aday sürümler, sağlayıcılar ve çakışmalar üzerinde CDCL çözücüyü
+        (bkz. alp.solver) çalıştırır. İstekler 'gcc>=11,<12' gibi sürüm
+        kısıtı içerebilir. Sonuç, istek, indeks durumu ve kurulu paketlere
+        göre önbellek dizininde saklanır; aynı girdilerle çözücü çalışmaz.
         Returns: {
-            'install': [paket listesi],
+            'install': [paket listesi, önce bağımlılıklar],
+            'waves': [[birlikte kurulabilecek paketler], ...],
+            'cycles': [[döngüdeki paket adları], ...],
             'conflicts': [çakışma listesi],
-            'missing': [eksik bağımlılıklar]
+            'conflict_pairs': [(çakışan, çakışılan) ad-sürüm çiftleri],
+            'missing': [eksik bağımlılıklar],
+            'explanation': [çözüm bulunamadıysa nedenleri]
         }
         """
-        to_install = []
-        conflicts = []
-        missing = []
-        visited = {}
-        requirements = {}
+        installed = self.database.get_installed_snapshot()
+        key = self._cache_key(package_names, installed)
         
-        queue = deque(package_names)
+        cached = self._load_cached(key)
+        if cached is not None:
+            return cached
         
-        while queue:
-            pkg_name = queue.popleft()
-            
-            required_version = requirements.get(pkg_name)
-            
-            if pkg_name in visited:
-                prev_req = visited[pkg_name]
-                if required_version and prev_req:
-                    if self.compare_versions(required_version, prev_req) > 0:
-                        visited[pkg_name] = required_version
-                    else:
-                        continue
-                elif not required_version:
-                    continue
-                else:
-                    visited[pkg_name] = required_version
-            else:
-                visited[pkg_name] = required_version
-            
-            pkg_metadata = self.repository.get_package_metadata(pkg_name)
-            
-            if not pkg_metadata:
-                missing.append(pkg_name)
-                continue
-            
-            if required_version:
-                if self.compare_versions(pkg_metadata['version'], required_version) < 0:
-                    missing.append(f"{pkg_name}>={required_version} (mevcut: {pkg_metadata['version']})")
-                    continue
-            
-            if self.database.is_installed(pkg_name):
-                installed_pkg = self.database.get_package(pkg_name)
-                if installed_pkg:
-                    if required_version:
-                        if self.compare_versions(installed_pkg['version'], required_version) >= 0:
-                            continue
-                    elif self.compare_versions(installed_pkg['version'], pkg_metadata['version']) >= 0:
-                        continue
-            
-            if self._check_conflicts(pkg_metadata, to_install):
-                conflicts.append(pkg_name)
-                continue
-            
-            already_in_install = False
-            for idx, existing_pkg in enumerate(to_install):
-                if existing_pkg['name'] == pkg_name:
-                    to_install[idx] = pkg_metadata
-                    already_in_install = True
-                    break
-            
-            if not already_in_install:
-                to_install.append(pkg_metadata)
-            
-            for dep in pkg_metadata.get('dependencies', []):
-                dep_name, dep_version = self.parse_dependency(dep)
-                
-                if dep_version:
-                    existing_req = requirements.get(dep_name)
-                    if existing_req:
-                        if self.compare_versions(dep_version, existing_req) > 0:
-                            requirements[dep_name] = dep_version
-                            if dep_name in visited:
-                                queue.append(dep_name)
-                    else:
-                        requirements[dep_name] = dep_version
-                
-                should_add = True
-                if self.database.is_installed(dep_name):
-                    installed_pkg = self.database.get_package(dep_name)
-                    
-                    if dep_version and installed_pkg:
-                        if self.compare_versions(installed_pkg['version'], dep_version) < 0:
-                            queue.append(dep_name)
-                            should_add = False
-                        else:
-                            should_add = False
-                    else:
-                        should_add = False
-                
-                if should_add:
-                    queue.append(dep_name)
+        solver = Solver(self.repository, installed, time_budget)
+        
+        try:
+            result = solver.solve(package_names)
+        except (SolverTimeout, ValueError) as e:
+            return {'install': [], 'waves': [], 'cycles': [], 'conflicts': [], 'conflict_pairs': [],
+                    'missing': [], 'explanation': [str(e)]}
         
-        return {
-            'install': to_install,
-            'conflicts': conflicts,
-            'missing': missing
+        waves, cycles = self.plan_waves(result.install)
+        
+        file_conflicts, manifests_complete = self.check_file_conflicts(result.install, installed)
+        if file_conflicts:
+            waves = []
+            for pkg, other, path, count in file_conflicts:
+                label = f"{pkg['name']}-{pkg['version']}"
+                if pkg['name'] not in result.conflicts:
+                    result.conflicts.append(pkg['name'])
+                result.conflict_pairs.append((label, other))
+                more = f" (and {count - 1} more files)" if count > 1 else ""
+                result.explanation.append(f"{label} and {other} both contain {path}{more}")
+        
+        resolution = {
+            'install': [pkg for wave in waves for pkg in wave],
+            'waves': waves,
+            'cycles': cycles,
+            'conflicts': result.conflicts,
+            'conflict_pairs': result.conflict_pairs,
+            'missing': result.missing,
+            'explanation': result.explanation
         }
+        # Alınamayan manifest dosya çakışmasını gizlemiş olabilir, sonraki
+        # çözümleme yeniden denesin
+        if manifests_complete:
+            self._store_cached(key, resolution)
+        
+        return resolution
+    
+    def check_file_conflicts(self, packages: List[Dict],
+                             installed: Dict[str, Dict]) -> Tuple[List[Tuple[Dict, str, str, int]], bool]:
+        """Plandaki paketlerin dosya çakışmaları
+        Dosya listeleri (manifestler) paralel alınır. Aynı dosyayı içeren iki
+        plan paketi ya da plandaki bir paketle, onun yükseltmediği kurulu bir
+        paket çakışır; kurulu sahipler dosya indeksinden tek seferde bulunur.
+        Alınamayan manifestler boş sayılır ve sonuç eksik işaretlenir.
+        Returns: ([(plan paketi, diğer paket ad-sürüm, ilk dosya, dosya sayısı)],
+                  tüm manifestler alındı mı)
+        """
+        if not packages:
+            return [], True
+        
+        failed = []
+        
+        def package_files(pkg: Dict) -> List[str]:
+            try:
+                return self.repository.get_package_files(pkg)
+            except Exception as e:
+                print(f"File manifest error: {e}")
+                failed.append(pkg['name'])
+                return []
+        
+        with ThreadPoolExecutor(max_workers=min(8, len(packages))) as executor:
+            file_lists = list(executor.map(package_files, packages))
+        
+        # (plan paketi sırası, diğer paket) -> [ilk dosya, sayı]
+        pairs = {}
+        planned_owner = {}
+        
+        for position, (pkg, files) in enumerate(zip(packages, file_lists)):
+            for path in files:
+                path = path.lstrip('/')
+                owner = planned_owner.setdefault(path, position)
+                if owner != position:
+                    other = packages[owner]
+                    pair = pairs.setdefault((position, f"{other['name']}-{other['version']}"), [path, 0])
+                    pair[1] += 1
+        
+        upgraded = {pkg['name'] for pkg in packages}
+        
+        for path, owners in self.database.get_file_owners(planned_owner).items():
+            for owner in owners:
+                if owner in upgraded:
+                    continue
+                label = f"{owner}-{installed[owner]['version']}" if owner in installed else owner
+                pair = pairs.setdefault((planned_owner[path], label), [path, 0])
+                pair[1] += 1
+        
+        conflicts = [(packages[position], other, path, count)
+                     for (position, other), (path, count) in pairs.items()]
+        return conflicts, not failed
+    
+    def _cache_key(self, package_names: List[str], installed: Dict[str, Dict]) -> str:
+        """Çözüm önbelleği anahtarı
+        Normalleştirilmiş istek, depo indekslerinin durumu ve kurulu
+        paketlerin hepsinden türetilir; biri değişince anahtar da değişir.
+        """
+        request = sorted({''.join(name.split()) for name in package_names})
+        data = [RESOLVE_CACHE_VERSION, request, self.repository.index_fingerprint(), installed]
+        return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def _cache_dir(self) -> str:
+        """Kalıcı çözüm önbelleği dizini"""
+        return os.path.join(self.repository.cache_dir, 'resolve')
+    
+    def _load_cached(self, key: str) -> Optional[Dict]:
+        """Önbellekteki çözüm, yoksa None"""
+        if key in self._cache:
+            return self._cache[key]
+        
+        cache_file = os.path.join(self._cache_dir(), f"{key}.json")
+        try:
+            with open(cache_file, 'r') as f:
+                resolution = json.load(f)
+            os.utime(cache_file)
+        except (OSError, ValueError):
+            return None
+        
+        resolution['install'] = [pkg for wave in resolution['waves'] for pkg in wave]
+        self._cache[key] = resolution
+        return resolution
     
-    def _check_conflicts(self, pkg_metadata: Dict, install_list: List[Dict]) -> bool:
-        """Çakışma kontrolü"""
-        pkg_conflicts = set(pkg_metadata.get('conflicts', []))
+    def _store_cached(self, key: str, resolution: Dict):
+        """Çözümü önbelleğe yaz, en eski kayıtları buda"""
+        self._cache[key] = resolution
+        
+        cache_dir = self._cache_dir()
+        cache_file = os.path.join(cache_dir, f"{key}.json")
         
-        for installed_pkg in install_list:
-            if installed_pkg['name'] in pkg_conflicts:
-                return True
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
             
-            if pkg_metadata['name'] in set(installed_pkg.get('conflicts', [])):
-                return True
+            tmp_path = f"{cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({k: v for k, v in resolution.items() if k != 'install'}, f)
+            os.replace(tmp_path, cache_file)
+            
+            entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                       if name.endswith('.json')]
+            if len(entries) > RESOLVE_CACHE_ENTRIES:
+                entries.sort(key=os.path.getmtime)
+                for path in entries[:len(entries) - RESOLVE_CACHE_ENTRIES]:
+                    os.remove(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Resolve cache error: {e}")
+    
+    def plan_waves(self, packages: List[Dict]) -> Tuple[List[List[Dict]], List[List[str]]]:
+        """Kurulum planını bağımsız dalgalara böl
+        Her paket, plandaki tüm bağımlılıklarından sonraki dalgaya girer
+        (Kahn seviyeleri); aynı dalgadaki paketler birbirine bağlı değildir,
+        birlikte indirilebilir. Bağımlılık döngüsündeki paketler aynı
+        dalgaya konur ve ayrıca raporlanır.
+        Returns: (dalgalar, döngüler)
+        """
+        # Plandaki paket adı / sağlanan ad -> sıra; gerçek ad önceliklidir
+        targets = {}
+        for position, pkg in enumerate(packages):
+            for provided in pkg.get('provides', []):
+                targets.setdefault(provided, position)
+        for position, pkg in enumerate(packages):
+            targets[pkg['name']] = position
+        
+        edges = []
+        for position, pkg in enumerate(packages):
+            needs = set()
+            for dep in pkg.get('dependencies', []):
+                dep_name, _ = self.parse_dependency(dep)
+                if dep_name in targets and targets[dep_name] != position:
+                    needs.add(targets[dep_name])
+            edges.append(needs)
+        
+        components = _components(edges)
+        component_of = {}
+        for number, component in enumerate(components):
+            for position in component:
+                component_of[position] = number
         
-        for conflict_pkg in pkg_conflicts:
-            if self.database.is_installed(conflict_pkg):
-                return True
+        # Bileşenler bağımlılıklardan sonra geldiği için seviye tek geçişte bulunur
+        levels = []
+        for number, component in enumerate(components):
+            needs = {component_of[dep] for position in component for dep in edges[position]}
+            needs.discard(number)
+            levels.append(1 + max((levels[dep] for dep in needs), default=-1))
         
-        return False
+        waves = [[] for _ in range(max(levels, default=-1) + 1)]
+        for position, pkg in enumerate(packages):
+            waves[levels[component_of[position]]].append(pkg)
+        
+        cycles = [
+            [packages[position]['name'] for position in component]
+            for component in components if len(component) > 1
+        ]
+        
+        return waves, cycles
     
-    def get_reverse_dependencies(self, package_name: str) -> List[str]:
-        """Ters bağımlılıklar - hangi paketler buna bağlı?"""
-        reverse_deps = []
+    def find_orphans(self) -> List[Dict]:
+        """Artık paketler (autoremove)
+        Açıkça kurulan paketlerden bağımlılık ve sağlayıcı kenarlarıyla
+        ulaşılan her şey işaretlenir, kalanlar döner. Sıra kaldırma
+        sırasıdır: önce bağımlılar, sonra bağımlılıkları.
+        """
+        installed = self.database.get_installed_snapshot()
         
-        all_packages = self.database.list_packages()
+        providers = defaultdict(list)
+        for name, pkg in installed.items():
+            providers[name].append(name)
+            for provided in pkg.get('provides', []):
+                if provided != name:
+                    providers[provided].append(name)
         
-        for pkg in all_packages:
-            pkg_full = self.database.get_package(pkg['name'])
-            deps = pkg_full.get('dependencies', [])
+        marked = set()
+        stack = [name for name, pkg in installed.items() if pkg.get('reason') != REASON_DEPENDENCY]
+        while stack:
+            name = stack.pop()
+            if name in marked:
+                continue
+            marked.add(name)
             
-            for dep in deps:
+            for dep in installed[name].get('dependencies', []):
                 dep_name, _ = self.parse_dependency(dep)
-                if dep_name == package_name:
-                    reverse_deps.append(pkg['name'])
-                    break
+                stack.extend(providers.get(dep_name, []))
         
-        return reverse_deps
+        orphans = [pkg for name, pkg in sorted(installed.items()) if name not in marked]
+        waves, _ = self.plan_waves(orphans)
+        
+        return [pkg for wave in reversed(waves) for pkg in wave]
+    
+    def get_reverse_dependencies(self, package_name: str, recursive: bool = False) -> List[str]:
+        """Ters bağımlılıklar - hangi paketler buna bağlı?
+        dependencies.dependency_name indeksi üzerinden tek sorgu; recursive
+        ile dolaylı bağımlılar da döner.
+        """
+        return self.database.get_reverse_dependencies(package_name, recursive)
     
-    def can_remove(self, package_name: str) -> Tuple[bool, List[str]]:
-        """Paket kaldırılabilir mi?"""
-        reverse_deps = self.get_reverse_dependencies(package_name)
+    def can_remove(self, package_name: str, removing: Iterable[str] = ()) -> Tuple[bool, List[str]]:
+        """Paket kaldırılabilir mi?
+        removing: aynı işlemde kaldırılacak paketler, engel sayılmaz
+        """
+        removing = set(removing)
+        reverse_deps = [
+            name for name in self.get_reverse_dependencies(package_name)
+            if name not in removing
+        ]
         
         if reverse_deps:
             return False, reverse_deps
@@ -0,0 +1,363 @@
+"""
+Full-text package search index
+Token and trigram postings over name, provides and description, built at
+index update time and persisted in the cache directory
+"""
+
+import os
+import re
+import mmap
+import struct
+import marshal
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from heapq import nsmallest
+from typing import List, Dict, Optional, Iterable, Tuple
+
+from .version import version_key
+
+
+SEARCH_INDEX_MAGIC = b'ALPSRCH\x00'
+SEARCH_INDEX_VERSION = 2
+
+_HEADER = struct.Struct('<8sII')
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Separators of the packed string tables
+_RECORD_SEP = '\x1e'
+_FIELD_SEP = '\x1f'
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens of text"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text: str) -> set:
+    """Set of 3-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _decode(posting) -> array:
+    """Decode a packed uint32 array"""
+    ids = array('I')
+    ids.frombytes(posting)
+    return ids
+
+
+def _intersect(postings: List) -> Iterable[int]:
+    """Doc ids present in every posting list, smallest list first"""
+    postings = sorted(postings, key=len)
+
+    if len(postings) == 1:
+        return _decode(postings[0])
+
+    result = set(_decode(postings[0]))
+    for posting in postings[1:]:
+        if not result:
+            break
+        result.intersection_update(_decode(posting))
+
+    return result
+
+
+def _pack(records: List[str]) -> Tuple[str, bytes]:
+    """Join records into one string plus a uint32 offset table"""
+    offsets = array('I', [0])
+    for record in records:
+        offsets.append(offsets[-1] + len(record) + 1)
+    return _RECORD_SEP.join(records) + _RECORD_SEP, offsets.tobytes()
+
+
+class _PackedStrings(Sequence):
+    """String list stored as one blob and an offset table
+    Supports bisect without splitting the blob.
+    """
+
+    def __init__(self, blob: str, offsets):
+        self.blob = blob
+        self.offsets = _decode(offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        return self.blob[self.offsets[position]:self.offsets[position + 1] - 1]
+
+
+class _PostingTable:
+    """Sorted keys mapped to uint32 posting lists in a shared buffer"""
+
+    def __init__(self, keys: _PackedStrings, bounds, data):
+        self.keys = keys
+        self.bounds = _decode(bounds)
+        self.data = data
+
+    @staticmethod
+    def pack(postings: Dict[str, array]) -> Tuple[Tuple[str, bytes, bytes], bytes]:
+        """Serialize a key -> doc ids mapping as (keys, bounds) and data"""
+        keys = sorted(postings)
+        bounds = array('I', [0])
+        data = array('I')
+
+        for key in keys:
+            data.extend(postings[key])
+            bounds.append(len(data))
+
+        blob, offsets = _pack(keys)
+        return (blob, offsets, bounds.tobytes()), data.tobytes()
+
+    def get(self, key: str):
+        """Packed posting list of key, None if absent"""
+        position = bisect_left(self.keys, key)
+
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+
+        return self.data[self.bounds[position] * 4:self.bounds[position + 1] * 4]
+
+
+class SearchIndex:
+    """Inverted index over repository packages
+
+    Doc ids are assigned in (name, repository priority) order, so exact and
+    prefix matches are id ranges and ranking within a tier is id order.
+    Ranking: exact name > name prefix > all tokens > substring.
+
+    The persisted file is a small header followed by sections that are
+    memory-mapped and decoded only when a query needs them; posting lists
+    are read straight from the mapping.
+    """
+
+    SECTIONS = ('names', 'tokens', 'token_postings', 'grams', 'gram_postings', 'texts', 'docs')
+    RAW_SECTIONS = ('token_postings', 'gram_postings')
+
+    def __init__(self, sources: List, sections: Dict):
+        self.sources = sources
+        self._sections = sections
+        self._cache: Dict = {}
+        self._mm = None
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    @classmethod
+    def build(cls, entries: Iterable[Tuple[str, Dict]], sources: List) -> 'SearchIndex':
+        """Build index from (repository name, package) pairs in priority order"""
+        rows = []
+        newest: Dict[Tuple[str, str], Tuple[int, Tuple]] = {}
+
+        # One doc per (repository, name): the newest version it serves
+        for repo_name, pkg in entries:
+            name = pkg.get('name')
+            if not name:
+                continue
+
+            version = pkg.get('version', '')
+            key = version_key(version)
+            current = newest.get((repo_name, name))
+            if current is not None and current[1] >= key:
+                continue
+
+            description = pkg.get('description', '') or ''
+            provides = ' '.join(pkg.get('provides', []) or [])
+            row = (name.lower(), len(rows) if current is None else rows[current[0]][1],
+                   name, version, description, repo_name, provides)
+
+            if current is None:
+                newest[(repo_name, name)] = (len(rows), key)
+                rows.append(row)
+            else:
+                newest[(repo_name, name)] = (current[0], key)
+                rows[current[0]] = row
+
+        rows.sort()
+
+        names = []
+        texts = []
+        docs = []
+        tokens: Dict[str, array] = {}
+        grams: Dict[str, array] = {}
+
+        for doc_id, (lower_name, _, name, version, description, repo_name, provides) in enumerate(rows):
+            text = f"{lower_name}\n{provides}\n{description}".lower()
+            text = text.replace(_RECORD_SEP, ' ')
+
+            names.append(lower_name)
+            texts.append(text)
+            docs.append(_FIELD_SEP.join((name, version, description, repo_name)).replace(_RECORD_SEP, ' '))
+
+            for token in set(tokenize(text)):
+                tokens.setdefault(token, array('I')).append(doc_id)
+
+            for gram in trigrams(text):
+                grams.setdefault(gram, array('I')).append(doc_id)
+
+        token_keys, token_postings = _PostingTable.pack(tokens)
+        gram_keys, gram_postings = _PostingTable.pack(grams)
+
+        return cls(sources, {
+            'names': _pack(names),
+            'tokens': token_keys,
+            'token_postings': token_postings,
+            'grams': gram_keys,
+            'gram_postings': gram_postings,
+            'texts': _pack(texts),
+            'docs': _pack(docs),
+        })
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SearchIndex']:
+        """Open persisted index, None if missing or from another format"""
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                magic, version, header_len = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != SEARCH_INDEX_MAGIC or version != SEARCH_INDEX_VERSION:
+                    return None
+                header = marshal.loads(f.read(header_len))
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, EOFError, ValueError, TypeError, struct.error):
+            return None
+
+        index = cls(header['sources'], {})
+        index._mm = mm
+        index._offsets = header['sections']
+        return index
+
+    def save(self, path: str) -> None:
+        """Persist index atomically"""
+        blobs = {}
+        for name in self.SECTIONS:
+            section = self._section(name)
+            blobs[name] = bytes(section) if name in self.RAW_SECTIONS else marshal.dumps(section)
+
+        offsets = {}
+        header_len = 0
+        # Offsets depend on the header size, which depends on the offsets
+        while True:
+            position = _HEADER.size + header_len
+            for name in self.SECTIONS:
+                offsets[name] = (position, len(blobs[name]))
+                position += len(blobs[name])
+            header = marshal.dumps({'sources': self.sources, 'sections': offsets})
+            if len(header) == header_len:
+                break
+            header_len = len(header)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(SEARCH_INDEX_MAGIC, SEARCH_INDEX_VERSION, header_len))
+            f.write(header)
+            for name in self.SECTIONS:
+                f.write(blobs[name])
+        os.replace(tmp_path, path)
+
+    def _section(self, name: str):
+        """Stored section, read from the mapped file on first use"""
+        section = self._sections.get(name)
+
+        if section is None:
+            start, length = self._offsets[name]
+            if name in self.RAW_SECTIONS:
+                section = memoryview(self._mm)[start:start + length]
+            else:
+                section = marshal.loads(self._mm[start:start + length])
+            self._sections[name] = section
+
+        return section
+
+    def _strings(self, name: str) -> _PackedStrings:
+        """Packed string table section"""
+        if name not in self._cache:
+            self._cache[name] = _PackedStrings(*self._section(name))
+        return self._cache[name]
+
+    def _postings(self, name: str, data_name: str) -> _PostingTable:
+        """Posting table section"""
+        if name not in self._cache:
+            blob, offsets, bounds = self._section(name)
+            self._cache[name] = _PostingTable(
+                _PackedStrings(blob, offsets), bounds, self._section(data_name)
+            )
+        return self._cache[name]
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Ranked search results"""
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        ranked: List[int] = []
+        seen = set()
+
+        def collect(doc_ids: Iterable[int]) -> bool:
+            doc_ids = (doc_id for doc_id in doc_ids if doc_id not in seen)
+            if limit is None:
+                doc_ids = sorted(doc_ids)
+            else:
+                doc_ids = nsmallest(limit - len(ranked), doc_ids)
+            seen.update(doc_ids)
+            ranked.extend(doc_ids)
+            return limit is not None and len(ranked) >= limit
+
+        names = self._strings('names')
+        exact = range(bisect_left(names, query), bisect_right(names, query))
+        prefix = range(exact.stop, bisect_left(names, query + '\U0010ffff'))
+
+        if not collect(exact) and not collect(prefix):
+            if not collect(self._token_matches(query)):
+                collect(self._substring_matches(query))
+
+        return [self._result(doc_id) for doc_id in ranked]
+
+    def _token_matches(self, query: str) -> Iterable[int]:
+        """Docs containing every token of query"""
+        tokens = self._postings('tokens', 'token_postings')
+        postings = [tokens.get(token) for token in set(tokenize(query))]
+
+        if not postings or None in postings:
+            return []
+
+        return _intersect(postings)
+
+    def _substring_matches(self, query: str) -> Iterable[int]:
+        """Docs containing query in name, provides or description"""
+        texts = self._strings('texts')
+
+        if len(query) < 3:
+            return self._scan(texts, query)
+
+        grams = self._postings('grams', 'gram_postings')
+        postings = [grams.get(gram) for gram in trigrams(query)]
+
+        if None in postings:
+            return []
+
+        return [doc_id for doc_id in _intersect(postings) if query in texts[doc_id]]
+
+    @staticmethod
+    def _scan(texts: _PackedStrings, query: str) -> List[int]:
+        """Linear scan of the packed texts, for queries too short for trigrams"""
+        matches = []
+        position = texts.blob.find(query)
+
+        while position != -1:
+            doc_id = bisect_right(texts.offsets, position) - 1
+            matches.append(doc_id)
+            position = texts.blob.find(query, texts.offsets[doc_id + 1])
+
+        return matches
+
+    def _result(self, doc_id: int) -> Dict:
+        """Result record of a doc"""
+        name, version, description, repo_name = self._strings('docs')[doc_id].split(_FIELD_SEP)
+
+        return {
+            'name': name,
+            'version': version,
+            'description': description,
+            'repository': repo_name,
+        }
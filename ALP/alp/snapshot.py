@@ -0,0 +1,174 @@
+"""
+Compiled repository index snapshots
+Binary, memory-mapped form of a cached index.json that loads without parsing
+every package record
+"""
+
+import os
+import json
+import mmap
+import struct
+from collections.abc import Sequence
+from functools import cached_property
+from typing import Dict, List, Optional
+
+
+SNAPSHOT_MAGIC = b'ALPSNAP\x00'
+SNAPSHOT_VERSION = 3
+
+# magic, format version, package count, source size, source mtime (ns),
+# meta length, names length, versions length, provides length
+_HEADER = struct.Struct('<8sIIQQIIII')
+
+
+def _padding(length: int) -> bytes:
+    """Zero bytes that align a section of the given length to 8 bytes"""
+    return b'\x00' * (-length % 8)
+
+
+def write_snapshot(index_data: Dict, snapshot_path: str, source_path: str) -> None:
+    """Compile index data into a snapshot bound to its source JSON file
+
+    Layout: header, meta JSON, newline separated names, versions and
+    space separated provides,
+    record offset table (count + 1 uint64) and compact JSON records.
+    """
+    packages = index_data.get('packages', [])
+    meta = {k: v for k, v in index_data.items() if k != 'packages'}
+    source_stat = os.stat(source_path)
+
+    meta_blob = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    names_blob = '\n'.join(pkg.get('name', '') for pkg in packages).encode('utf-8')
+    versions_blob = '\n'.join(pkg.get('version', '') for pkg in packages).encode('utf-8')
+    provides_blob = '\n'.join(' '.join(pkg.get('provides', []) or []) for pkg in packages).encode('utf-8')
+
+    records = [json.dumps(pkg, separators=(',', ':')).encode('utf-8') for pkg in packages]
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(packages),
+        source_stat.st_size, source_stat.st_mtime_ns,
+        len(meta_blob), len(names_blob), len(versions_blob), len(provides_blob)
+    )
+
+    tmp_path = f"{snapshot_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(_padding(len(header)))
+        f.write(meta_blob)
+        f.write(_padding(len(meta_blob)))
+        f.write(names_blob)
+        f.write(_padding(len(names_blob)))
+        f.write(versions_blob)
+        f.write(_padding(len(versions_blob)))
+        f.write(provides_blob)
+        f.write(_padding(len(provides_blob)))
+        f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        for record in records:
+            f.write(record)
+
+    os.replace(tmp_path, snapshot_path)
+
+
+def load_snapshot(snapshot_path: str, source_path: str) -> Optional['IndexSnapshot']:
+    """Open a snapshot, None if missing, invalid or stale"""
+    if not os.path.exists(snapshot_path) or not os.path.exists(source_path):
+        return None
+
+    try:
+        snapshot = IndexSnapshot(snapshot_path)
+    except (OSError, ValueError):
+        return None
+
+    source_stat = os.stat(source_path)
+    if (snapshot.source_size, snapshot.source_mtime_ns) != \
+       (source_stat.st_size, source_stat.st_mtime_ns):
+        snapshot.close()
+        return None
+
+    return snapshot
+
+
+class IndexSnapshot(Sequence):
+    """Read-only package sequence over a memory-mapped snapshot
+    Records are decoded on first access.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mm) < _HEADER.size:
+            self.close()
+            raise ValueError(f"Truncated snapshot: {path}")
+
+        (magic, version, count, self.source_size, self.source_mtime_ns,
+         meta_len, names_len, versions_len, provides_len) = _HEADER.unpack_from(self._mm, 0)
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported snapshot: {path}")
+
+        pos = _HEADER.size + len(_padding(_HEADER.size))
+        self.meta = json.loads(self._mm[pos:pos + meta_len])
+        pos += meta_len + len(_padding(meta_len))
+
+        names_blob = self._mm[pos:pos + names_len].decode('utf-8')
+        self.names: List[str] = names_blob.split('\n') if count else []
+        pos += names_len + len(_padding(names_len))
+
+        versions_blob = self._mm[pos:pos + versions_len].decode('utf-8')
+        self.versions: List[str] = versions_blob.split('\n') if count else []
+        pos += versions_len + len(_padding(versions_len))
+
+        self._provides_span = (pos, pos + provides_len)
+        pos += provides_len + len(_padding(provides_len))
+
+        self._offsets = memoryview(self._mm)[pos:pos + (count + 1) * 8].cast('Q')
+        self._records_start = pos + (count + 1) * 8
+        self._decoded: Dict[int, Dict] = {}
+
+    @cached_property
+    def provides(self) -> List[List[str]]:
+        """Provided names of every package, split on first use"""
+        if not self.names:
+            return []
+        start, end = self._provides_span
+        return [line.split() for line in self._mm[start:end].decode('utf-8').split('\n')]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+
+        if position < 0:
+            position += len(self)
+
+        record = self._decoded.get(position)
+        if record is None:
+            start = self._records_start + self._offsets[position]
+            end = self._records_start + self._offsets[position + 1]
+            record = json.loads(self._mm[start:end])
+            self._decoded[position] = record
+
+        return record
+
+    def to_index(self) -> Dict:
+        """Index dict whose packages are lazily decoded from the snapshot"""
+        index_data = dict(self.meta)
+        index_data['packages'] = self
+        return index_data
+
+    def close(self):
+        """Unmap the snapshot file"""
+        offsets = getattr(self, '_offsets', None)
+        if offsets is not None:
+            offsets.release()
+            self._offsets = None
+        self._mm.close()
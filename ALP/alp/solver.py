@@ -0,0 +1,598 @@
+"""
+Dependency solver
+Encodes an install request over every candidate version, installed
+package, provider and conflict as boolean clauses and solves them with
+unit propagation and conflict-driven clause learning
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from .version import parse_constraint, satisfies_all, version_key
+
+
+@dataclass
+class SolverResult:
+    """Outcome of a solver run"""
+    satisfiable: bool = True
+    install: List[Dict] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    conflicts: List[str] = field(default_factory=list)
+    conflict_pairs: List[Tuple[str, str]] = field(default_factory=list)
+    explanation: List[str] = field(default_factory=list)
+
+
+class SolverTimeout(Exception):
+    """The solver ran out of its time budget"""
+
+
+class Solver:
+    """CDCL solver over package candidates
+
+    Every candidate (an available version or the installed one) is a
+    variable. Clauses state that requested packages are installed, that a
+    selected candidate has each dependency satisfied by some candidate or
+    provider, that at most one version of a name is selected, that
+    conflicting candidates (by name or provided name) exclude each other
+    and that installed packages
+    stay installed (possibly upgraded).
+
+    Decisions follow the requirements of already selected packages, picking
+    the preferred candidate of the first unsatisfied one: installed versions
+    for dependencies, the newest version for requested packages. Candidates
+    nothing requires are left out. Each clause remembers which original
+    clauses it was derived from, so an unsatisfiable request is explained
+    by the requirements that caused it.
+    """
+
+    CHECK_INTERVAL = 64
+
+    def __init__(self, repository, installed: Dict[str, Dict], time_budget: float = 10.0):
+        self.repository = repository
+        self.installed = installed
+        self.time_budget = time_budget
+
+        # Problem: candidates and clauses
+        self._packages: List[Optional[Dict]] = [None]
+        self._by_name: Dict[str, List[int]] = {}
+        self._clauses: List[List[int]] = []
+        self._origins: List[frozenset] = []
+        self._descriptions: List[str] = []
+        self._requires: Dict[int, List[int]] = {}
+        self._roots: List[int] = []
+        self._missing: Dict[int, str] = {}
+        self._conflicting: Dict[int, Tuple[int, int]] = {}
+        self._expand_queue: deque = deque()
+
+        # Conflict maps, kept up to date as candidates and conflicts appear:
+        # conflicted name -> (declaring variable, constraints), and name ->
+        # variables of candidates named so or providing it
+        self._conflicts_on: Dict[str, List[Tuple[int, Tuple]]] = {}
+        self._targets: Dict[str, List[int]] = {}
+        self._conflict_pairs: Set[Tuple[int, int]] = set()
+
+        # Installed reverse maps, to pull affected installed packages in
+        self._installed_dependents: Dict[str, List[str]] = {}
+        self._installed_conflicting: Dict[str, List[str]] = {}
+        self._installed_providers: Dict[str, List[str]] = {}
+        for name, pkg in installed.items():
+            for dep in pkg.get('dependencies', []):
+                self._installed_dependents.setdefault(self._spec_name(dep), []).append(name)
+            for conflict in pkg.get('conflicts', []):
+                self._installed_conflicting.setdefault(self._spec_name(conflict), []).append(name)
+            for provided in pkg.get('provides', []):
+                self._installed_providers.setdefault(provided, []).append(name)
+
+        # Search state
+        self._value: List[Optional[bool]] = [None]
+        self._level: List[int] = [0]
+        self._reason: List[Optional[int]] = [None]
+        self._watches: Dict[int, List[int]] = {}
+        self._trail: List[int] = []
+        self._trail_lim: List[int] = []
+        self._qhead = 0
+        self._pending: deque = deque()
+        self._deadline = 0.0
+
+    @staticmethod
+    def _spec_name(spec: str) -> str:
+        """Package name of a dependency or conflict spec"""
+        try:
+            return parse_constraint(spec)[0]
+        except ValueError:
+            return spec.strip()
+
+    def _label(self, var: int) -> str:
+        """name-version of a candidate"""
+        pkg = self._packages[var]
+        return f"{pkg['name']}-{pkg['version']}"
+
+    # Problem construction
+
+    def _candidates(self, name: str, requested: bool = False) -> List[int]:
+        """Variables of every candidate of a name, created on first use
+        Ordered by preference: the installed version first, except for
+        requested packages where newer versions come first.
+        """
+        if name in self._by_name:
+            return self._by_name[name]
+
+        installed = self.installed.get(name)
+        packages = []
+        if installed is not None:
+            packages.append(dict(installed, installed=True))
+
+        for candidate in self.repository.get_candidates(name):
+            if installed is None or version_key(candidate['version']) != version_key(installed['version']):
+                packages.append(candidate)
+
+        if requested and installed is not None:
+            installed_key = version_key(installed['version'])
+            packages = [pkg for pkg in packages[1:] if version_key(pkg['version']) > installed_key] + \
+                       [packages[0]] + \
+                       [pkg for pkg in packages[1:] if version_key(pkg['version']) < installed_key]
+
+        variables = []
+        for pkg in packages:
+            self._packages.append(pkg)
+            self._value.append(None)
+            self._level.append(0)
+            self._reason.append(None)
+            variables.append(len(self._packages) - 1)
+
+        self._by_name[name] = variables
+        self._expand_queue.append(name)
+
+        for var in variables:
+            self._add_target(var)
+
+        return variables
+
+    def _add_target(self, var: int):
+        """Index a new candidate under its name and provided names, and
+        check it against the conflicts already declared on them
+        """
+        pkg = self._packages[var]
+
+        self._targets.setdefault(pkg['name'], []).append(var)
+        for declaring, constraints in self._conflicts_on.get(pkg['name'], []):
+            self._add_conflict(declaring, constraints, var, pkg['name'])
+
+        for provided in pkg.get('provides') or []:
+            if provided == pkg['name']:
+                continue
+            self._targets.setdefault(provided, []).append(var)
+            for declaring, constraints in self._conflicts_on.get(provided, []):
+                self._add_conflict(declaring, constraints, var, provided)
+
+    def _add_conflicts_on(self, var: int, spec: str):
+        """Record that a candidate conflicts with spec and exclude every
+        known candidate it matches
+        """
+        try:
+            name, constraints = parse_constraint(spec)
+        except ValueError:
+            name, constraints = spec.strip(), ()
+
+        self._conflicts_on.setdefault(name, []).append((var, constraints))
+        for other in self._targets.get(name, []):
+            self._add_conflict(var, constraints, other, name)
+
+        # Installed packages it would clash with have to be part of the problem
+        if name in self.installed:
+            self._candidates(name)
+        for provider in self._installed_providers.get(name, []):
+            self._candidates(provider)
+
+    def _add_conflict(self, var: int, constraints: Tuple, other: int, name: str):
+        """Exclude var and other together if other matches the conflict
+        A versioned conflict only matches the real package, not providers.
+        """
+        if other == var or (var, other) in self._conflict_pairs:
+            return
+
+        matches = satisfies_all(self._packages[other]['version'], constraints) \
+            if self._packages[other]['name'] == name else not constraints
+        if not matches:
+            return
+
+        self._conflict_pairs.add((var, other))
+        index = self._add_clause([-var, -other], f"{self._label(var)} conflicts with {self._label(other)}")
+        self._conflicting[index] = (var, other)
+
+    def _add_clause(self, literals: List[int], description: Optional[str] = None,
+                    origins: Optional[frozenset] = None) -> int:
+        """Store a clause, original when described, learnt otherwise"""
+        index = len(self._clauses)
+        self._clauses.append(literals)
+
+        if description is not None:
+            self._descriptions.append(description)
+            self._origins.append(frozenset([index]))
+        else:
+            self._descriptions.append('')
+            self._origins.append(origins)
+
+        if len(literals) >= 2:
+            self._watches.setdefault(literals[0], []).append(index)
+            self._watches.setdefault(literals[1], []).append(index)
+
+        return index
+
+    def _build(self, requests: List[str]):
+        """Encode the request and everything reachable from it"""
+        for spec in requests:
+            name, constraints = parse_constraint(spec)
+            options = [var for var in self._candidates(name, requested=True)
+                       if satisfies_all(self._packages[var]['version'], constraints)]
+            if not constraints:
+                options += self._provider_options(name, exclude=options)
+
+            index = self._add_clause(options, f"{spec} was requested")
+            self._roots.append(index)
+            if not options:
+                self._missing[index] = spec
+
+        while self._expand_queue:
+            name = self._expand_queue.popleft()
+            self._check_time()
+
+            for var in list(self._by_name[name]):
+                self._encode_candidate(var)
+
+            if name in self.installed:
+                index = self._add_clause(list(self._by_name[name]),
+                                         f"{name} is installed and cannot be removed")
+                self._roots.append(index)
+
+            # Installed packages whose dependencies or conflicts involve name
+            for other in self._installed_dependents.get(name, []) + self._installed_conflicting.get(name, []):
+                self._candidates(other)
+
+            # Installed packages conflicting with a name its candidates provide
+            for var in self._by_name[name]:
+                for provided in self._packages[var].get('provides') or []:
+                    for other in self._installed_conflicting.get(provided, []):
+                        self._candidates(other)
+
+        by_name_items = list(self._by_name.items())
+
+        for name, variables in by_name_items:
+            for i, var in enumerate(variables):
+                for other in variables[i + 1:]:
+                    self._add_clause([-var, -other], f"only one version of {name} can be installed")
+
+    def _provider_options(self, name: str, exclude: List[int]) -> List[int]:
+        """Candidates of other packages that provide name"""
+        options = []
+        provider_names = self._installed_providers.get(name, []) + self.repository.find_providers(name)
+
+        for provider in provider_names:
+            for var in self._candidates(provider):
+                if var not in exclude and var not in options \
+                   and name in (self._packages[var].get('provides') or []):
+                    options.append(var)
+
+        return options
+
+    def _encode_candidate(self, var: int):
+        """Dependency and conflict clauses of a candidate"""
+        pkg = self._packages[var]
+        label = self._label(var)
+
+        for dep in pkg.get('dependencies', []):
+            try:
+                name, constraints = parse_constraint(dep)
+            except ValueError:
+                name, constraints = dep.strip(), ()
+
+            options = [other for other in self._candidates(name)
+                       if satisfies_all(self._packages[other]['version'], constraints)]
+            if not constraints:
+                options += self._provider_options(name, exclude=options)
+
+            # Breakage that predates this transaction is not ours to fix
+            if not options and pkg.get('installed'):
+                continue
+
+            index = self._add_clause([-var] + options, f"{label} depends on {dep}")
+            self._requires.setdefault(var, []).append(index)
+            if not options:
+                self._missing[index] = dep
+
+        for conflict in pkg.get('conflicts', []):
+            self._add_conflicts_on(var, conflict)
+
+    # Search
+
+    def _value_of(self, literal: int) -> Optional[bool]:
+        value = self._value[abs(literal)]
+        if value is None:
+            return None
+        return value if literal > 0 else not value
+
+    def _enqueue(self, literal: int, reason: Optional[int]) -> bool:
+        """Assign a literal, False if it is already false"""
+        value = self._value_of(literal)
+        if value is not None:
+            return value
+
+        var = abs(literal)
+        self._value[var] = literal > 0
+        self._level[var] = len(self._trail_lim)
+        self._reason[var] = reason
+        self._trail.append(literal)
+
+        if literal > 0:
+            self._pending.extend(self._requires.get(var, []))
+
+        return True
+
+    def _propagate(self) -> Optional[int]:
+        """Unit propagation over watched literals, returns a conflicting clause"""
+        while self._qhead < len(self._trail):
+            false_literal = -self._trail[self._qhead]
+            self._qhead += 1
+
+            watching = self._watches.get(false_literal, [])
+            kept = []
+            conflict = None
+
+            for position, index in enumerate(watching):
+                clause = self._clauses[index]
+
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+
+                if self._value_of(clause[0]) is True:
+                    kept.append(index)
+                    continue
+
+                for k in range(2, len(clause)):
+                    if self._value_of(clause[k]) is not False:
+                        clause[1], clause[k] = clause[k], clause[1]
+                        self._watches.setdefault(clause[1], []).append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if not self._enqueue(clause[0], index):
+                        conflict = index
+                        kept.extend(watching[position + 1:])
+                        break
+
+            self._watches[false_literal] = kept
+
+            if conflict is not None:
+                return conflict
+
+        return None
+
+    def _analyze(self, conflict: int) -> Tuple[List[int], int, frozenset]:
+        """First-UIP learnt clause, backjump level and its origins"""
+        seen: Set[int] = set()
+        learnt = [0]
+        origins = set(self._origins[conflict])
+        current_level = len(self._trail_lim)
+        counter = 0
+        literal = None
+        clause = self._clauses[conflict]
+        position = len(self._trail) - 1
+
+        while True:
+            for other in clause:
+                var = abs(other)
+                if literal is not None and var == abs(literal):
+                    continue
+                if var in seen:
+                    continue
+                seen.add(var)
+
+                if self._level[var] == 0:
+                    origins |= self._var_origins(var)
+                elif self._level[var] == current_level:
+                    counter += 1
+                else:
+                    learnt.append(other)
+
+            while abs(self._trail[position]) not in seen:
+                position -= 1
+
+            literal = self._trail[position]
+            position -= 1
+            counter -= 1
+
+            if counter == 0:
+                break
+
+            reason = self._reason[abs(literal)]
+            clause = self._clauses[reason]
+            origins |= self._origins[reason]
+
+        learnt[0] = -literal
+
+        backjump = 0
+        if len(learnt) > 1:
+            deepest = max(range(1, len(learnt)), key=lambda i: self._level[abs(learnt[i])])
+            learnt[1], learnt[deepest] = learnt[deepest], learnt[1]
+            backjump = self._level[abs(learnt[1])]
+
+        return learnt, backjump, frozenset(origins)
+
+    def _var_origins(self, var: int) -> Set[int]:
+        """Original clauses behind a level 0 assignment"""
+        origins = set()
+        stack = [var]
+        visited = set()
+
+        while stack:
+            var = stack.pop()
+            if var in visited:
+                continue
+            visited.add(var)
+
+            reason = self._reason[var]
+            if reason is None:
+                continue
+
+            origins |= self._origins[reason]
+            stack.extend(abs(other) for other in self._clauses[reason] if abs(other) != var)
+
+        return origins
+
+    def _backtrack(self, level: int):
+        """Undo assignments above level"""
+        if len(self._trail_lim) <= level:
+            return
+
+        for literal in self._trail[self._trail_lim[level]:]:
+            var = abs(literal)
+            self._value[var] = None
+            self._reason[var] = None
+
+        del self._trail[self._trail_lim[level]:]
+        del self._trail_lim[level:]
+        self._qhead = len(self._trail)
+
+        # Requirements of packages still selected may be open again
+        self._pending = deque(self._roots)
+        for literal in self._trail:
+            if literal > 0:
+                self._pending.extend(self._requires.get(literal, []))
+
+    def _decide(self) -> Optional[int]:
+        """Next decision literal, None when the assignment is complete
+        Picks the preferred open candidate of the first unsatisfied
+        requirement. Once every requirement of the selected packages holds,
+        leaving the remaining candidates out satisfies all clauses.
+        """
+        while self._pending:
+            clause = self._clauses[self._pending.popleft()]
+
+            if any(self._value_of(literal) is True for literal in clause):
+                continue
+
+            # Candidate variables are created in preference order
+            open_literals = [literal for literal in clause
+                             if literal > 0 and self._value[literal] is None]
+            if open_literals:
+                return min(open_literals)
+
+        return None
+
+    def _check_time(self):
+        if time.monotonic() > self._deadline:
+            raise SolverTimeout(f"Dependency solving exceeded {self.time_budget:g} s")
+
+    def _explain(self, origins: Set[int]) -> Tuple[List[str], List[str], List[str], List[Tuple[str, str]]]:
+        """Explanation lines, missing specs, conflicting names and
+        conflicting name-version pairs of a set of clauses
+        """
+        explanation = []
+        missing = []
+        conflicts = []
+        pairs = []
+
+        for index in sorted(origins, key=lambda i: (i not in self._roots, i)):
+            description = self._descriptions[index]
+            if index in self._missing:
+                missing.append(self._missing[index])
+                description += ", which no repository provides"
+            if description not in explanation:
+                explanation.append(description)
+            if index in self._conflicting:
+                var, other = self._conflicting[index]
+                if self._packages[var]['name'] not in conflicts:
+                    conflicts.append(self._packages[var]['name'])
+                pairs.append((self._label(var), self._label(other)))
+
+        return explanation, missing, conflicts, pairs
+
+    def _unsatisfiable(self, origins: Set[int]) -> SolverResult:
+        explanation, missing, conflicts, pairs = self._explain(origins)
+        return SolverResult(satisfiable=False, missing=missing, conflicts=conflicts,
+                            conflict_pairs=pairs, explanation=explanation)
+
+    def solve(self, requests: List[str]) -> SolverResult:
+        """Find packages to install or upgrade for requests
+        Raises SolverTimeout when the time budget is exhausted.
+        """
+        self._deadline = time.monotonic() + self.time_budget
+        self._build(requests)
+
+        self._pending = deque(self._roots)
+
+        for index, clause in enumerate(self._clauses):
+            if not clause:
+                return self._unsatisfiable(set(self._origins[index]))
+            if len(clause) == 1 and not self._enqueue(clause[0], index):
+                origins = set(self._origins[index]) | self._var_origins(abs(clause[0]))
+                return self._unsatisfiable(origins)
+
+        steps = 0
+
+        while True:
+            conflict = self._propagate()
+
+            if conflict is not None:
+                if not self._trail_lim:
+                    origins = set(self._origins[conflict])
+                    for literal in self._clauses[conflict]:
+                        origins |= self._var_origins(abs(literal))
+                    return self._unsatisfiable(origins)
+
+                learnt, backjump, origins = self._analyze(conflict)
+                self._backtrack(backjump)
+
+                index = self._add_clause(learnt, origins=origins)
+                self._enqueue(learnt[0], index)
+            else:
+                literal = self._decide()
+
+                if literal is None:
+                    return SolverResult(install=self._selection())
+
+                self._trail_lim.append(len(self._trail))
+                self._enqueue(literal, None)
+
+            steps += 1
+            if steps % self.CHECK_INTERVAL == 0:
+                self._check_time()
+
+    def _selection(self) -> List[Dict]:
+        """Selected candidates that are not installed yet, dependencies first"""
+        selected = {}
+        for var in range(1, len(self._value)):
+            if self._value[var]:
+                selected[self._packages[var]['name']] = var
+
+        order = []
+        visited = set()
+
+        def chosen_dependencies(var: int):
+            for index in self._requires.get(var, []):
+                for literal in self._clauses[index]:
+                    if literal > 0 and self._value[literal]:
+                        yield literal
+
+        # Iterative post-order walk: dependency chains can be deeper than
+        # the recursion limit
+        for root in sorted(selected.values()):
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, chosen_dependencies(root))]
+
+            while stack:
+                var, dependencies = stack[-1]
+                for dependency in dependencies:
+                    if dependency not in visited:
+                        visited.add(dependency)
+                        stack.append((dependency, chosen_dependencies(dependency)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(var)
+
+        return [self._packages[var] for var in order if not self._packages[var].get('installed')]
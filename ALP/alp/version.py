@@ -0,0 +1,202 @@
+"""
+Version keys and constraint matching
+
+Versions have the form [epoch:]upstream[-revision]. Upstream and revision
+are compared like Debian versions: alternating non-digit and digit runs,
+digits numerically, '~' sorting before everything (even the end of the
+string) so it marks pre-releases. A '-' followed by a letter also starts a
+pre-release ('1.2.3-rc1' == '1.2.3~rc1'), a '-' followed by a digit starts
+the package revision. Trailing '.0' segments are ignored, so '1.0' and
+'1.0.0' are equal.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+
+_RUN_RE = re.compile(r'(\d+)')
+_SPEC_RE = re.compile(r'\s*([^\s<>=!,]+)\s*(.*?)\s*$')
+_CONSTRAINT_RE = re.compile(r'\s*(>=|<=|==|!=|>|<|=)\s*([^\s,<>=!]+)\s*')
+_PRERELEASE_DASH_RE = re.compile(r'-(?=[A-Za-z])')
+
+# Weight of the end of a non-digit run
+_END = (0,)
+
+
+def _char_weight(char: str) -> int:
+    """Sort weight of a character in a non-digit run"""
+    if char == '~':
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+# Key of a '.' separator run
+_DOT = (_char_weight('.'),) + _END
+
+
+def _part_key(part: str) -> Tuple:
+    """Key of an upstream version or revision
+    Alternating non-digit run and number items, starting and ending with
+    a non-digit run (the end marker when the part ends in a number).
+    """
+    runs = _RUN_RE.split(part)
+    key = []
+
+    # split() gives text, digits, text, ..., text
+    for position in range(0, len(runs), 2):
+        text = runs[position]
+
+        # '.0' before the end or a pre-release is dropped: '1.0' == '1',
+        # '1.0~rc1' == '1~rc1'
+        if position and (not text or text.startswith('~')):
+            while len(key) >= 4 and key[-2] == _DOT and key[-1] == 0:
+                del key[-2:]
+
+        key.append(tuple(_char_weight(char) for char in text) + _END)
+        if position + 1 < len(runs):
+            key.append(int(runs[position + 1]))
+
+    return tuple(key)
+
+
+@lru_cache(maxsize=65536)
+def version_key(version: str) -> Tuple:
+    """Totally ordered sort key of a version, parsed once and cached"""
+    epoch = 0
+    head, sep, rest = version.partition(':')
+    if sep and head.isdigit():
+        epoch = int(head)
+        version = rest
+
+    upstream, revision = version, '0'
+    head, sep, rest = version.rpartition('-')
+    if sep and rest[:1].isdigit():
+        upstream, revision = head, rest
+
+    upstream = _PRERELEASE_DASH_RE.sub('~', upstream)
+
+    return epoch, _part_key(upstream), _part_key(revision)
+
+
+def compare_versions(version1: str, version2: str) -> int:
+    """Returns: -1 if v1 < v2, 0 if equal, 1 if v1 > v2"""
+    key1 = version_key(version1)
+    key2 = version_key(version2)
+    return (key1 > key2) - (key1 < key2)
+
+
+def _key_matches(key: Tuple, op: str, bound_key: Tuple) -> bool:
+    """Does a version key satisfy 'op bound'?"""
+    if op == '>=':
+        return key >= bound_key
+    if op == '>':
+        return key > bound_key
+    if op == '<=':
+        return key <= bound_key
+    if op == '<':
+        return key < bound_key
+    if op in ('=', '=='):
+        return key == bound_key
+    if op == '!=':
+        return key != bound_key
+    raise ValueError(f"Unknown version operator: {op}")
+
+
+def satisfies(version: str, op: Optional[str], bound: Optional[str]) -> bool:
+    """Does version satisfy 'op bound'? No op matches everything"""
+    if not op:
+        return True
+
+    return _key_matches(version_key(version), op, version_key(bound))
+
+
+def sort_versions(versions: Iterable[str], reverse: bool = False) -> List[str]:
+    """Versions in ascending order, newest first with reverse"""
+    return sorted(versions, key=version_key, reverse=reverse)
+
+
+def filter_versions(versions: Iterable[str], op: Optional[str], bound: Optional[str]) -> List[str]:
+    """Versions satisfying 'op bound', in their original order"""
+    if not op:
+        return list(versions)
+
+    bound_key = version_key(bound)
+    return [version for version in versions if _key_matches(version_key(version), op, bound_key)]
+
+
+def split_dependency(spec: str) -> Tuple[str, str]:
+    """Split a dependency into its name and constraint text
+    Example: 'gcc >= 11.0,<12' -> ('gcc', '>= 11.0,<12')
+    """
+    match = _SPEC_RE.match(spec)
+    if not match:
+        raise ValueError(f"Invalid dependency: {spec!r}")
+
+    return match.group(1), match.group(2)
+
+
+@lru_cache(maxsize=65536)
+def parse_constraint(spec: str) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    """Split a dependency into its name and version constraints
+    Example: 'gcc>=11.0,<12' -> ('gcc', (('>=', '11.0'), ('<', '12')))
+    """
+    name, rest = split_dependency(spec)
+    constraints = []
+
+    if rest:
+        for part in rest.split(','):
+            constraint = _CONSTRAINT_RE.fullmatch(part)
+            if not constraint:
+                raise ValueError(f"Invalid version constraint: {spec!r}")
+            constraints.append((constraint.group(1), constraint.group(2)))
+
+    return name, tuple(constraints)
+
+
+def satisfies_all(version: str, constraints: Iterable[Tuple[str, str]]) -> bool:
+    """Does version satisfy every (op, bound) constraint?"""
+    if not constraints:
+        return True
+
+    key = version_key(version)
+    return all(_key_matches(key, op, version_key(bound)) for op, bound in constraints)
+
+
+def best_index(keys: List[Tuple], op: Optional[str], bound: Optional[str]) -> Optional[int]:
+    """Position of the highest key satisfying 'op bound' in ascending keys"""
+    if not keys:
+        return None
+
+    top = len(keys) - 1
+
+    if not op:
+        return top
+
+    bound_key = version_key(bound)
+
+    if op in ('>=', '>'):
+        return top if _key_matches(keys[top], op, bound_key) else None
+
+    if op in ('=', '=='):
+        position = bisect_right(keys, bound_key) - 1
+        return position if position >= 0 and keys[position] == bound_key else None
+
+    if op == '<=':
+        position = bisect_right(keys, bound_key) - 1
+        return position if position >= 0 else None
+
+    if op == '<':
+        position = bisect_left(keys, bound_key) - 1
+        return position if position >= 0 else None
+
+    if op == '!=':
+        position = top
+        while position >= 0 and keys[position] == bound_key:
+            position -= 1
+        return position if position >= 0 else None
+
+    raise ValueError(f"Unknown version operator: {op}")
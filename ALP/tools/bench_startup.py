@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+CLI startup time benchmark
+Runs quick commands in fresh interpreters and fails when they get slower
+than the budget or load modules only network/package commands need
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+ALP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = [['--version'], ['list'], ['--help']]
+
+# Must stay unimported for the commands above
+HEAVY_MODULES = ['requests', 'yaml', 'alp.repository', 'alp.resolver', 'alp.downloader']
+
+# Runs the CLI in-process and reports which heavy modules it loaded
+PROBE = """
+import sys, json
+from alp.cli import cli
+try:
+    cli.main(args=sys.argv[1:], prog_name='alp', standalone_mode=False)
+except SystemExit:
+    pass
+sys.stdout = sys.__stdout__
+print(json.dumps([name for name in %r if name in sys.modules]))
+"""
+
+
+def timed_run(args, env, runs):
+    """Median wall time (ms) of a command in fresh interpreters"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ALP_DIR, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def loaded_modules(args, env):
+    """Heavy modules loaded while running a command"""
+    result = subprocess.run([sys.executable, '-c', PROBE % HEAVY_MODULES] + args, cwd=ALP_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(runs, budget):
+    """Benchmark every command, returns the process exit code"""
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ,
+                   ALP_DB_PATH=os.path.join(data_dir, 'packages.db'),
+                   ALP_CACHE_DIR=os.path.join(data_dir, 'cache'),
+                   ALP_LOG_DIR=os.path.join(data_dir, 'logs'))
+
+        # Create the database once, later runs open an up-to-date schema
+        timed_run(['alp_cli.py', 'list'], env, 1)
+
+        baseline = timed_run(['-c', 'pass'], env, runs)
+        print(f"Interpreter startup: {baseline:.1f} ms (subtracted below)")
+
+        failed = False
+        for args in COMMANDS:
+            elapsed = timed_run(['alp_cli.py'] + args, env, runs) - baseline
+            heavy = loaded_modules(args, env)
+
+            status = '✓'
+            if elapsed > budget or heavy:
+                status = '✗'
+                failed = True
+
+            print(f"{status} alp {' '.join(args):<12} {elapsed:6.1f} ms")
+            if heavy:
+                print(f"    loaded: {', '.join(heavy)}")
+
+        return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark ALP CLI startup time')
+    parser.add_argument('--runs', type=int, default=10, help='Runs per command (default: 10)')
+    parser.add_argument('--budget', type=float, default=80,
+                        help='Allowed ms per command on top of interpreter startup (default: 80)')
+    args = parser.parse_args()
+
+    sys.exit(main(args.runs, args.budget))
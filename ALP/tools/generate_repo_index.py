@@ -6,10 +6,164 @@ Scans .alp packages and creates index.json
 import json
 import os
 import sys
+import hashlib
 from alp.package import Package
+from alp.repository import diff_indexes, shard_of
+from alp.index_stream import available_formats, write_compressed
 
 
-def generate_repo_index(packages_dir, repo_name, repo_description, output_path=None):
+def load_previous_index(output_path):
+    """Load the index being replaced, None if there is none"""
+    if not os.path.exists(output_path):
+        return None
+    
+    try:
+        with open(output_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Warning: Previous index unreadable, no delta written: {e}")
+        return None
+
+
+def write_deltas(repo_dir, previous, index, keep_deltas):
+    """
+    Write deltas/<revision>.json for a changed index and prune old ones
+    
+    Args:
+        repo_dir: Repository root directory
+        previous: Index being replaced (None for a new repository)
+        index: New index, its revision already set
+        keep_deltas: Number of deltas to keep
+    
+    Returns:
+        Oldest revision a client can update from with deltas
+    """
+    deltas_dir = os.path.join(repo_dir, 'deltas')
+    os.makedirs(deltas_dir, exist_ok=True)
+    
+    revision = index['revision']
+    
+    if previous is not None and previous.get('revision') is not None \
+       and previous['revision'] != revision:
+        delta = diff_indexes(previous, index)
+        delta['from_revision'] = previous['revision']
+        delta['revision'] = revision
+        
+        with open(os.path.join(deltas_dir, f"{previous['revision']}.json"), 'w') as f:
+            json.dump(delta, f)
+        
+        print(f"   Delta {previous['revision']} -> {revision}: "
+              f"{len(delta['upsert'])} changed, {len(delta['remove'])} removed")
+    
+    oldest = revision
+    for filename in os.listdir(deltas_dir):
+        base, ext = os.path.splitext(filename)
+        if ext != '.json' or not base.isdigit():
+            continue
+        
+        delta_revision = int(base)
+        if delta_revision >= revision or delta_revision < revision - keep_deltas:
+            os.remove(os.path.join(deltas_dir, filename))
+        else:
+            oldest = min(oldest, delta_revision)
+    
+    # The chain is only usable if it has no gaps
+    for delta_revision in range(oldest, revision):
+        if not os.path.exists(os.path.join(deltas_dir, f"{delta_revision}.json")):
+            oldest = delta_revision + 1
+    
+    return oldest
+
+
+def write_manifests(repo_dir, manifests):
+    """
+    Write manifests/<name>-<version>.json file lists
+    
+    Existing manifests with the same content are left untouched.
+    """
+    manifests_dir = os.path.join(repo_dir, 'manifests')
+    os.makedirs(manifests_dir, exist_ok=True)
+    
+    for (name, version), files in manifests.items():
+        manifest = {'name': name, 'version': version, 'files': files}
+        manifest_path = os.path.join(manifests_dir, f"{name}-{version}.json")
+        
+        if os.path.exists(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    if json.load(f) == manifest:
+                        continue
+            except (OSError, ValueError):
+                pass
+        
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+
+
+def write_shards(repo_dir, index, shard_count):
+    """
+    Write shards/<n>.json by package name hash plus shards/manifest.json
+    
+    Shards whose content is unchanged are left untouched, so clients keep
+    their cached copies. The manifest carries the index metadata, the hash
+    of each shard and the provides map, so clients can resolve virtual
+    packages without fetching every shard.
+    
+    Returns:
+        Path of the manifest relative to repo_dir
+    """
+    shards_dir = os.path.join(repo_dir, 'shards')
+    os.makedirs(shards_dir, exist_ok=True)
+    
+    buckets = [[] for _ in range(shard_count)]
+    provides = {}
+    for pkg in index['packages']:
+        buckets[shard_of(pkg['name'], shard_count)].append(pkg)
+        for provided in pkg.get('provides', []):
+            providers = provides.setdefault(provided, [])
+            if pkg['name'] not in providers:
+                providers.append(pkg['name'])
+    
+    shards = []
+    for number, bucket in enumerate(buckets):
+        data = json.dumps({'packages': bucket}, separators=(',', ':')).encode('utf-8')
+        filename = f"{number}.json"
+        shard_path = os.path.join(shards_dir, filename)
+        
+        unchanged = False
+        if os.path.exists(shard_path):
+            with open(shard_path, 'rb') as f:
+                unchanged = f.read() == data
+        
+        if not unchanged:
+            with open(shard_path, 'wb') as f:
+                f.write(data)
+        
+        shards.append({
+            'file': filename,
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'packages': len(bucket),
+        })
+    
+    # Shards of a previous, larger shard count
+    for filename in os.listdir(shards_dir):
+        base, ext = os.path.splitext(filename)
+        if ext == '.json' and base.isdigit() and int(base) >= shard_count:
+            os.remove(os.path.join(shards_dir, filename))
+    
+    manifest = {k: v for k, v in index.items() if k != 'packages'}
+    manifest.update({'shard_dir': 'shards', 'shards': shards, 'provides': provides})
+    
+    with open(os.path.join(shards_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    
+    print(f"   Shards: {shard_count} ({max(len(b) for b in buckets)} packages in the largest)")
+    
+    return 'shards/manifest.json'
+
+
+def generate_repo_index(packages_dir, repo_name, repo_description, output_path=None,
+                        deltas=False, keep_deltas=20, embed_files=False, shards=0):
     """
     Scan packages directory and automatically generate index.json
     
@@ -18,6 +172,12 @@ def generate_repo_index(packages_dir, repo_name, repo_description, output_path=N
         repo_name: Repository name
         repo_description: Repository description
         output_path: Optional custom output path for index.json
+        deltas: Also write revision deltas against the previous index.json
+        keep_deltas: Number of deltas to keep when writing deltas
+        embed_files: Keep file lists in index.json instead of writing
+            per-package manifests (for older clients)
+        shards: Also split the index into this many shards for large
+            repositories (0 disables sharding)
     """
     
     if not os.path.exists(packages_dir):
@@ -25,6 +185,7 @@ def generate_repo_index(packages_dir, repo_name, repo_description, output_path=N
         sys.exit(1)
     
     packages = []
+    manifests = {}
     
     print(f"📦 Scanning packages in: {packages_dir}")
     
@@ -56,10 +217,14 @@ def generate_repo_index(packages_dir, repo_name, repo_description, output_path=N
                 'homepage': meta.homepage,
                 'license': meta.license,
                 'size': meta.size,
-                'checksum': meta.checksum,
-                'files': meta.files  # Automatically included from package scan
+                'checksum': meta.checksum
             }
             
+            # File lists only matter at install time, they go to manifests
+            if embed_files:
+                package_info['files'] = meta.files
+            manifests[(meta.name, meta.version)] = meta.files
+            
             packages.append(package_info)
             
             print(f"    ✅ {meta.name}-{meta.version}")
@@ -77,21 +242,65 @@ def generate_repo_index(packages_dir, repo_name, repo_description, output_path=N
         'version': '1.0',
         'packages': packages
     }
+    if not embed_files:
+        index['manifests'] = 'manifests'
     
     # Determine output path
     if output_path is None:
         output_path = os.path.join(os.path.dirname(packages_dir), 'index.json')
+    repo_dir = os.path.dirname(os.path.abspath(output_path))
+    
+    # Bump the revision only when the content changed
+    previous = load_previous_index(output_path)
+    if previous is None or previous.get('revision') is None:
+        index['revision'] = 1
+    else:
+        changed = diff_indexes(previous, index)
+        if changed['meta'] or changed['upsert'] or changed['remove']:
+            index['revision'] = previous['revision'] + 1
+        else:
+            index['revision'] = previous['revision']
+    
+    if not embed_files:
+        write_manifests(repo_dir, manifests)
+    
+    oldest_delta = index['revision']
+    if deltas:
+        oldest_delta = write_deltas(repo_dir, previous, index, keep_deltas)
+    
+    # Write index.json and its compressed variants, left untouched when
+    # unchanged so their ETags stay valid
+    compressed = [f"{output_path}.{fmt[len('json.'):]}" for fmt in available_formats() if fmt != 'json']
+    if previous is None or previous.get('revision') != index['revision'] \
+       or not all(os.path.exists(path) for path in compressed):
+        with open(output_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        
+        with open(output_path, 'rb') as f:
+            formats = write_compressed(f.read(), output_path)
+    else:
+        formats = [fmt for fmt in available_formats() if fmt != 'json']
+    
+    revision = {
+        'revision': index['revision'],
+        'oldest_delta': oldest_delta,
+        'formats': ['json'] + formats
+    }
+    if shards > 0:
+        revision['shards'] = write_shards(repo_dir, index, shards)
     
-    # Write index.json
-    with open(output_path, 'w') as f:
-        json.dump(index, f, indent=2)
+    # Write revision.json, lets clients skip unchanged indexes
+    with open(os.path.join(repo_dir, 'revision.json'), 'w') as f:
+        json.dump(revision, f)
     
     print(f"\n✅ Repository index generated: {output_path}")
     print(f"   Repository: {repo_name}")
     print(f"   Packages: {len(packages)}")
+    print(f"   Revision: {index['revision']}")
     print(f"\n📋 Package Summary:")
     for pkg in packages:
-        print(f"   - {pkg['name']}-{pkg['version']}: {len(pkg['files'])} files, {pkg['size'] / (1024*1024):.2f} MB")
+        files = manifests[(pkg['name'], pkg['version'])]
+        print(f"   - {pkg['name']}-{pkg['version']}: {len(files)} files, {pkg['size'] / (1024*1024):.2f} MB")
 
 
 if __name__ == '__main__':
@@ -102,6 +311,10 @@ if __name__ == '__main__':
     parser.add_argument('--name', default='custom-repo', help='Repository name')
     parser.add_argument('--description', default='Custom ALP Repository', help='Repository description')
     parser.add_argument('--output', help='Output path for index.json (default: <repo_dir>/index.json)')
+    parser.add_argument('--deltas', action='store_true', help='Write incremental deltas against the previous index.json')
+    parser.add_argument('--keep-deltas', type=int, default=20, help='Number of deltas to keep (default: 20)')
+    parser.add_argument('--embed-files', action='store_true', help='Embed file lists in index.json instead of writing manifests/')
+    parser.add_argument('--shards', type=int, default=0, help='Also split the index into N name-hashed shards/ (default: 0, off)')
     
     args = parser.parse_args()
     
@@ -109,5 +322,9 @@ if __name__ == '__main__':
         packages_dir=args.packages_dir,
         repo_name=args.name,
         repo_description=args.description,
-        output_path=args.output
+        output_path=args.output,
+        deltas=args.deltas,
+        keep_deltas=args.keep_deltas,
+        embed_files=args.embed_files,
+        shards=args.shards
     )